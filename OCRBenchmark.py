@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import numpy as np
+import cv2
+import OCR_1
+import OCR_2
+import OCR_3
+import Puzzles
+import OCRModels
+from SudokuExtractor import SudokuExtractor, ExtractionContext
+from SudokuBenchmark import percentile, formatSeconds
+
+# Summary
+# -------
+# Benchmarks the OCR backends, OCR_1 (kNN), OCR_2 (SVM on HOG features) and
+# OCR_3 (kNN on quantized PCA features), for speed and accuracy.
+#
+# Each backend is run over two sets of digits:
+#   digits.png  the 5000 20x20 digits of the sheet, cropped to their bounding
+#               rectangles, with 500 of each digit 0-9. The models are trained
+#               on this sheet, so its accuracy is a best case.
+#   grids       the digits the extractor crops from sudoku photos, recognized a
+#               grid at a time as the extractor does. Photos with a known
+#               puzzle (see GROUND_TRUTH, or --truth) are also checked.
+#
+# For each backend it reports model file size and load time, digits per second (in one batch,
+# and one digit at a time), p50/p99 latency of recognizing a grid, and accuracy
+# overall and per digit. Grid digits in the wrong cells are counted apart, as
+# missed or extra digits, since those are extraction errors rather than OCR ones.
+#
+# Usage
+# -----
+# python OCRBenchmark.py -o ocr_report.json
+# python OCRBenchmark.py --ocr OCR_2 --images photo.jpg --truth "photo.jpg=<the 81 digits of its puzzle>"
+#
+# The report is JSON, like SudokuBenchmark's, and a summary is written to stderr.
+#
+
+REPORT_VERSION = 1
+
+OCR_CLASSES = {
+    'OCR_1': OCR_1.OCR,
+    'OCR_2': OCR_2.OCR,
+    'OCR_3': OCR_3.OCR,
+}
+
+OCR_ORDER = ['OCR_1', 'OCR_2', 'OCR_3']
+
+DEFAULT_IMAGES = ['sudoku_original.jpg', 'sudoku_original_2.jpg', 'sudoku_original_3.jpg', 'sudoku_original_4.jpg']
+
+# Known puzzles of the sample photos, by filename
+GROUND_TRUTH = {
+    'sudoku_original_3.jpg': Puzzles.image3,
+}
+
+
+# Every digit of a sheet like digits.png, cropped to its bounding rectangle, and its label.
+# The sheet is a grid of 20x20 digits, with the rows of each digit from 0 to 9 in turn.
+def loadDigitSheet(filename):
+    gray = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise IOError("No such image file: %s" % filename)
+    _, gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY)
+
+    rows = gray.shape[0] / 20
+    cols = gray.shape[1] / 20
+    digits = []
+    labels = []
+    for r in range(0, rows):
+        for c in range(0, cols):
+            cell = gray[r*20:r*20+20, c*20:c*20+20]
+            ys, xs = np.nonzero(cell)
+            if len(ys) == 0:
+                continue
+            digits.append(cell[ys.min():ys.max()+1, xs.min():xs.max()+1])
+            labels.append(r * 10 / rows)
+    return digits, labels
+
+
+# The digit crops of each photo, and the cells they are in, as the extractor passes them to the OCR.
+# Photos where no grid is found are left out.
+def loadGrids(images, truths):
+    extractor = SudokuExtractor(headless=True)
+    ctx = ExtractionContext()
+    grids = []
+    for image in images:
+        extractor.getPuzzle(ctx, image)
+        extractor.locatePuzzle(ctx)
+        if ctx.contour_approx is None:
+            sys.stderr.write("No grid found in %s, skipping it\n" % image)
+            continue
+        extractor.simpleWarp(ctx)
+        extractor.extractDigits(ctx)
+
+        grids.append({
+            'image': image,
+            # Copied, as the crops are views of the context's buffers
+            'digits': [digit.copy() for digit in ctx.digit_images],
+            'cells': list(ctx.digit_cells),
+            'truth': truths.get(os.path.basename(image)),
+        })
+    return grids
+
+
+# Adds a recognized digit and its true label to per-class counts
+def countDigit(classes, label, value):
+    counts = classes.setdefault(str(label), {'total': 0, 'correct': 0})
+    counts['total'] += 1
+    counts['correct'] += int(value) == label
+
+
+# Overall accuracy, and accuracy per class, of per-class counts
+def accuracies(classes):
+    total = sum(counts['total'] for counts in classes.values())
+    correct = sum(counts['correct'] for counts in classes.values())
+    perClass = dict((label, float(counts['correct']) / counts['total']) for label, counts in classes.items())
+    return (float(correct) / total if total else None), perClass
+
+
+# Loads a model, building it first if needed, and returns it with the seconds taken to load it.
+# Raises IOError if the model file is missing and cannot be built.
+def loadOCR(ocr_class):
+    # Training prints its progress to stderr, to keep the report valid JSON
+    OCRModels.prepareModel(ocr_class)
+
+    start = time.time()
+    ocr = ocr_class()
+    ocr.loadData()
+    return ocr, time.time() - start
+
+
+def benchmark(name, ocr, loadSeconds, sheet, grids, repeat, single):
+
+    # Whole sheet in one call
+    digits, labels = sheet
+    start = time.time()
+    values, _ = ocr.recognizeCharacters(digits)
+    batchSeconds = time.time() - start
+
+    sheetClasses = {}
+    for label, value in zip(labels, values):
+        countDigit(sheetClasses, label, value)
+    sheetAccuracy, sheetClassAccuracy = accuracies(sheetClasses)
+
+    # One digit at a time, as before batching
+    singleDigits = digits[:single]
+    start = time.time()
+    for digit in singleDigits:
+        ocr.recognizeCharacter(digit)
+    singleSeconds = time.time() - start
+
+    # A grid at a time, as the extractor does
+    gridTimes = []
+    gridDigits = 0
+    for _ in range(0, repeat):
+        for grid in grids:
+            start = time.time()
+            ocr.recognizeCharacters(grid['digits'])
+            gridTimes.append(time.time() - start)
+            gridDigits += len(grid['digits'])
+    gridTimes.sort()
+
+    gridClasses = {}
+    missed = 0
+    extra = 0
+    for grid in grids:
+        truth = grid['truth']
+        if truth is None:
+            continue
+        values, _ = ocr.recognizeCharacters(grid['digits'])
+        found = set()
+        for (x, y), value in zip(grid['cells'], values):
+            found.add((x, y))
+            if truth[y][x] == 0:
+                extra += 1
+            else:
+                countDigit(gridClasses, truth[y][x], value)
+        missed += sum(1 for y in range(0, 9) for x in range(0, 9) if truth[y][x] != 0 and (x, y) not in found)
+    gridAccuracy, gridClassAccuracy = accuracies(gridClasses)
+
+    return {
+        'ocr': name,
+        'modelBytes': os.path.getsize(OCR_CLASSES[name].model_filename),
+        'loadSeconds': loadSeconds,
+        'sheetDigits': len(digits),
+        'batchDigitsPerSecond': len(digits) / batchSeconds if batchSeconds else None,
+        'singleDigitsPerSecond': len(singleDigits) / singleSeconds if singleSeconds else None,
+        'sheetAccuracy': sheetAccuracy,
+        'sheetClassAccuracy': sheetClassAccuracy,
+        'grids': len(grids),
+        'gridDigitsPerSecond': gridDigits / sum(gridTimes) if sum(gridTimes) else None,
+        'p50GridSeconds': percentile(gridTimes, 50),
+        'p99GridSeconds': percentile(gridTimes, 99),
+        'gridAccuracy': gridAccuracy,
+        'gridClassAccuracy': gridClassAccuracy,
+        'missedDigits': missed,
+        'extraDigits': extra,
+    }
+
+
+def formatRate(rate):
+    return '-' if rate is None else '%.0f/s' % rate
+
+
+def formatAccuracy(accuracy):
+    return '-' if accuracy is None else '%.1f%%' % (accuracy * 100)
+
+
+def printSummary(results, stream):
+    stream.write('%-6s %9s %9s %10s %10s %10s %9s %9s %9s %9s\n' % (
+        'ocr', 'model KB', 'load', 'batch', 'single', 'grid', 'p50', 'p99', 'sheet', 'grids'))
+    for r in results:
+        stream.write('%-6s %9d %9s %10s %10s %10s %9s %9s %9s %9s\n' % (
+            r['ocr'], r['modelBytes'] / 1024, formatSeconds(r['loadSeconds']),
+            formatRate(r['batchDigitsPerSecond']), formatRate(r['singleDigitsPerSecond']), formatRate(r['gridDigitsPerSecond']),
+            formatSeconds(r['p50GridSeconds']), formatSeconds(r['p99GridSeconds']),
+            formatAccuracy(r['sheetAccuracy']), formatAccuracy(r['gridAccuracy'])))
+
+    stream.write('\naccuracy per digit (sheet / grids)\n')
+    for r in results:
+        stream.write('%-6s' % r['ocr'])
+        for label in range(0, 10):
+            stream.write(' %d:%s/%s' % (label,
+                formatAccuracy(r['sheetClassAccuracy'].get(str(label))),
+                formatAccuracy(r['gridClassAccuracy'].get(str(label)))))
+        stream.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the OCR backends for speed and accuracy.")
+    parser.add_argument("--ocr", nargs="+", choices=OCR_ORDER, default=OCR_ORDER,
+                        help="OCR backends to run (default: all)")
+    parser.add_argument("--sheet", default="digits.png",
+                        help="sheet of 20x20 digits, 0-9 in rows (default: digits.png)")
+    parser.add_argument("--images", nargs="+", default=DEFAULT_IMAGES,
+                        help="sudoku photos to recognize (default: the sample photos)")
+    parser.add_argument("--truth", action="append", default=[], metavar="IMAGE=PUZZLE",
+                        help="known puzzle of a photo, as 81 characters (can be repeated)")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="number of times to recognize each grid (default: 20)")
+    parser.add_argument("--single", type=int, default=500,
+                        help="number of sheet digits to recognize one at a time (default: 500)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="file to write the JSON report to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    truths = dict(GROUND_TRUTH)
+    for truth in args.truth:
+        image, _, text = truth.partition('=')
+        puzzle = Puzzles.parse(text)
+        if puzzle is None:
+            parser.error("Not a puzzle: %s" % text)
+        truths[os.path.basename(image)] = puzzle
+
+    sheet = loadDigitSheet(args.sheet)
+    grids = loadGrids(args.images, truths)
+
+    # Backends whose model cannot be loaded are skipped, and the rest still reported
+    results = []
+    skipped = []
+    for name in args.ocr:
+        try:
+            ocr, loadSeconds = loadOCR(OCR_CLASSES[name])
+        except (IOError, cv2.error) as e:
+            sys.stderr.write("Skipping %s, its model could not be loaded: %s\n" % (name, e))
+            skipped.append(name)
+            continue
+        results.append(benchmark(name, ocr, loadSeconds, sheet, grids, args.repeat, args.single))
+
+    report = {
+        'version': REPORT_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'opencv': cv2.__version__,
+        'repeat': args.repeat,
+        'images': [grid['image'] for grid in grids],
+        'results': results,
+        'skipped': skipped,
+    }
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    # The summary goes to stderr, so stdout stays valid JSON
+    printSummary(results, sys.stderr)
+
+
+
+#
+#   Main Entry Point
+#
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import hashlib
+import threading
+
+# Summary
+# -------
+# Keeps one trained OCR model per OCR class for the whole process.
+#
+# A model is loaded from its data file the first time it is asked for, and the
+# same OCR object is then shared by every extractor and thread.
+#
+# Each data file has a .stamp file next to it, holding the model version and a
+# hash of the training image it was built from. If the OCR class's version or
+# the training image has changed since, the model is stale and is rebuilt
+# from the training image before it is loaded.
+#
+# Usage
+# -----
+# ocr = getOCR(OCR_1.OCR)
+# buildModel(OCR_1.OCR) to rebuild a model's data file by hand.
+# prepareModel(OCR_1.OCR) to rebuild it only if stale, for tools whose stdout is their output.
+#
+
+lock = threading.Lock()
+models = {}
+
+
+def fileHash(filename):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+# Model version and training image hash, as recorded in a stamp file
+def currentStamp(ocr_class):
+    return "%d %s" % (ocr_class.model_version, fileHash(ocr_class.training_filename))
+
+
+# Raises IOError if the model can neither be loaded nor built
+def isStale(ocr_class):
+    if not os.path.exists(ocr_class.model_filename):
+        if not os.path.exists(ocr_class.training_filename):
+            raise IOError("No model file %s, and no training image %s to build it from"
+                          % (ocr_class.model_filename, ocr_class.training_filename))
+        return True
+    # Without the training image the model cannot be rebuilt, so use it as it is
+    if not os.path.exists(ocr_class.training_filename):
+        return False
+
+    stamp_filename = ocr_class.model_filename + '.stamp'
+    if not os.path.exists(stamp_filename):
+        return True
+    with open(stamp_filename) as f:
+        return f.read().strip() != currentStamp(ocr_class)
+
+
+# Trains a model from its training image, and saves it with its stamp
+def buildModel(ocr_class):
+    if not os.path.exists(ocr_class.training_filename):
+        raise IOError("No training image %s to build %s from"
+                      % (ocr_class.training_filename, ocr_class.model_filename))
+    ocr = ocr_class()
+    ocr.processTrainingImage()
+    ocr.saveData()
+    with open(ocr_class.model_filename + '.stamp', 'w') as f:
+        f.write(currentStamp(ocr_class) + '\n')
+
+
+# Rebuilds a model if it is stale, with the training's progress printed to stderr
+# instead of stdout
+def prepareModel(ocr_class):
+    if not isStale(ocr_class):
+        return
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        buildModel(ocr_class)
+    finally:
+        sys.stdout = stdout
+
+
+# Returns the shared OCR of a class, loading it on first use
+def getOCR(ocr_class):
+    ocr = models.get(ocr_class)
+    if ocr is not None:
+        return ocr
+
+    with lock:
+        # Another thread may have loaded it while this one waited
+        ocr = models.get(ocr_class)
+        if ocr is None:
+            if isStale(ocr_class):
+                buildModel(ocr_class)
+            ocr = ocr_class()
+            ocr.loadData()
+            models[ocr_class] = ocr
+    return ocr
@@ -21,20 +21,27 @@ import cv2
 # -----
 # Run this python file to generate data file
 # 
-# Use loadData() to load data file
+# Use loadData() to load data file, or OCRModels.getOCR(OCR) for the model shared by the whole process
 # Use recognizeCharacter() to recognize a character, by passing in a digit cropped to bounding rectangle.
+# Use recognizeCharacterWithConfidence() to also get how sure the recognition is (0 to 1).
+# Use recognizeCharacters() to recognize a list of characters at once.
 #
 
 class OCR:
-	knn = cv2.KNearest()
+	knn = None
 	train_data = []
 	train_labels = []
 
+	# Files used by OCRModels. Bump model_version when the features change, so saved models are rebuilt.
+	model_filename = 'knn_digit_data_1.npz'
+	training_filename = 'digits_modified.png'
+	model_version = 1
+
 	SZ=20
 	affine_flags = cv2.WARP_INVERSE_MAP|cv2.INTER_LINEAR
 
 	def processTrainingImage(self):		
-		img = cv2.imread('digits_modified.png')
+		img = cv2.imread(self.training_filename)
 		gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
 		_,gray = cv2.threshold(gray,0,255,cv2.THRESH_BINARY)
 
@@ -65,24 +72,45 @@ class OCR:
 
 
 	def saveData(self):
-		np.savez('knn_digit_data_1.npz',train_data=self.train_data, train_labels=self.train_labels)
+		np.savez(self.model_filename,train_data=self.train_data, train_labels=self.train_labels)
 
 
 	def loadData(self):
-		with np.load('knn_digit_data_1.npz') as data:
+		with np.load(self.model_filename) as data:
 			self.train_data = data['train_data']
 			self.train_labels = data['train_labels']
+		self.knn = cv2.KNearest()
 		self.knn.train(np.array(self.train_data), np.array(self.train_labels))
 
 
 	# img takes in image of character cropped to its bounding rectangle
 	def recognizeCharacter(self, img):
+		return self.recognizeCharacterWithConfidence(img)[0]
+
+
+	# Returns the character, and the fraction of the nearest neighbours that agree with it
+	def recognizeCharacterWithConfidence(self, img):
+		results, confidences = self.recognizeCharacters([img])
+		return results[0], confidences[0]
+
+
+	# Recognizes many characters with a single kNN call.
+	# imgs is a list of characters cropped to their bounding rectangles, from one grid or many.
+	# Returns an array of the characters, and an array of their confidences.
+	def recognizeCharacters(self, imgs):
+		if len(imgs) == 0:
+			return np.zeros(0, np.float32), np.zeros(0, np.float32)
+		features = np.float32([self.feature(img) for img in imgs])
+		ret,results,neighbours,dist = self.knn.find_nearest(features, k=5)
+		confidences = (neighbours == results).sum(axis=1) / float(neighbours.shape[1])
+		return results.ravel(), confidences
+
+
+	# Pixel values of the resized and deskewed character
+	def feature(self, img):
 		feature = self.resizeToSquare(img)
 		feature = self.deskew(feature)
-		feature = feature.reshape(1, 20*20)
-		feature = np.float32(feature)
-		ret,result,neighbours,dist = self.knn.find_nearest(feature, k=5)
-		return result[0][0]
+		return feature.reshape(20*20)
 		
 
 	# Resize image to a square. Maintains scale and pads edges if necessary.
@@ -109,6 +137,5 @@ class OCR:
 		return img
 
 if __name__ == '__main__':
-	ocr = OCR()
-	ocr.processTrainingImage()
-	ocr.saveData()
+	from OCRModels import buildModel
+	buildModel(OCR)
@@ -21,8 +21,10 @@ import cv2
 # -----
 # Run this python file to generate data file
 # 
-# Use loadData() to load data file
+# Use loadData() to load data file, or OCRModels.getOCR(OCR) for the model shared by the whole process
 # Use recognizeCharacter() to recognize a character, by passing in a digit cropped to bounding rectangle.
+# Use recognizeCharacterWithConfidence() to also get how sure the recognition is (0 to 1).
+# Use recognizeCharacters() to recognize a list of characters at once.
 #
 
 class OCR:
@@ -35,16 +37,21 @@ class OCR:
 
 	affine_flags = cv2.WARP_INVERSE_MAP|cv2.INTER_LINEAR
 
-	svm = cv2.SVM()
+	svm = None
 	train_data = []
 	train_labels = []
 
+	# Files used by OCRModels. Bump model_version when the features change, so saved models are rebuilt.
+	model_filename = 'svm_digit_data_2.dat'
+	training_filename = 'digits_modified.png'
+	model_version = 1
+
 	def processTrainingImage(self):		
-		img = cv2.imread('digits_modified.png')
+		img = cv2.imread(self.training_filename)
 		gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
 		_,gray = cv2.threshold(gray,0,255,cv2.THRESH_BINARY)
 
-		train_data = []
+		digit_images = []
 		train_labels = []
 		
 		# get contours
@@ -55,41 +62,66 @@ class OCR:
 		    if area>18:
 				label = int(y/100)
 
-				digit_image = gray[y:y+h,x:x+w]
-				digit_image = self.resizeToSquare(digit_image)
-				digit_image = self.deskew(digit_image)
-				data = self.hog(digit_image)
-
-				train_data.append(data)
+				digit_images.append(gray[y:y+h,x:x+w])
 				train_labels.append([label])
 
-		train_data = np.float32(train_data).reshape(-1,64)
+		train_data = self.features(digit_images)
 		train_labels = np.float32(train_labels)
 
 		self.train_data = train_data
 		self.train_labels = train_labels
 
+		self.svm = cv2.SVM()
 		self.svm.train(self.train_data, self.train_labels, params=self.svm_params)
 		print "Processed", len(self.train_labels), "characters."
 
 
 	def saveData(self):
-		self.svm.save('svm_digit_data_2.dat')
+		self.svm.save(self.model_filename)
 
 
 	def loadData(self):
-		self.svm.load('svm_digit_data_2.dat')
+		self.svm = cv2.SVM()
+		self.svm.load(self.model_filename)
 
 
 	# img takes in image of character cropped to its bounding rectangle
 	def recognizeCharacter(self, img):
-		feature = self.resizeToSquare(img)
-		feature = self.deskew(feature)
-		feature = self.hog(feature)
-		feature = np.float32(feature)
+		feature = np.float32(self.feature(img))
 		result = self.svm.predict(feature)
 		return result
-		
+
+
+	# Returns the character, and how sure the recognition is (0 to 1).
+	# The SVM gives no score for a multi-class prediction, so every prediction is fully confident.
+	def recognizeCharacterWithConfidence(self, img):
+		return self.recognizeCharacter(img), 1.0
+
+
+	# Recognizes many characters with a single SVM call.
+	# imgs is a list of characters cropped to their bounding rectangles, from one grid or many.
+	# Returns an array of the characters, and an array of their confidences.
+	def recognizeCharacters(self, imgs):
+		if len(imgs) == 0:
+			return np.zeros(0, np.float32), np.zeros(0, np.float32)
+		results = self.svm.predict_all(self.features(imgs))
+		return results.ravel(), np.ones(len(imgs), np.float32)
+
+
+	# HOG features of the resized and deskewed character
+	def feature(self, img):
+		feature = self.resizeToSquare(img)
+		feature = self.deskew(feature)
+		return self.hog(feature)
+
+
+	# HOG features of a list of characters, as an (N, 64) array.
+	# Same as feature() on each character, but deskews and computes HOG for all of them at once.
+	def features(self, imgs):
+		squares = self.resizeToSquareBatch(imgs)
+		squares = self.deskewBatch(squares)
+		return self.hogBatch(squares)
+
 
 	# Resize image to a square. Maintains scale and pads edges if necessary.
 	def resizeToSquare(self, image, length=16, padding=2):
@@ -106,6 +138,22 @@ class OCR:
 		return image_resized
 
 
+	# resizeToSquare for a list of images, returned as an (N, length+2*padding, length+2*padding) stack.
+	# Each image is resized straight into its place in the stack, instead of being padded step by step.
+	def resizeToSquareBatch(self, images, length=16, padding=2):
+		size = length + 2*padding
+		squares = np.zeros((len(images), size, size), np.uint8)
+		for n, image in enumerate(images):
+			(h, w) = image.shape
+			ratio = min(float(length)/float(w), float(length)/float(h))
+			image_resized = cv2.resize(image, (0,0), fx=ratio, fy=ratio)
+			(h, w) = image_resized.shape
+			top = padding + (length-h)/2
+			left = padding + (length-w)/2
+			squares[n, top:top+h, left:left+w] = image_resized
+		return squares
+
+
 	def deskew(self, img):
 		m = cv2.moments(img)
 		if abs(m['mu02']) < 1e-2:
@@ -115,6 +163,56 @@ class OCR:
 		img = cv2.warpAffine(img,M,(self.SZ, self.SZ),flags=self.affine_flags)
 		return img
 
+
+	# deskew for an (N, SZ, SZ) stack of images.
+	# The moments are computed for the whole stack at once, and every image is sheared
+	# by one remap over the stack laid out as a single tall image.
+	def deskewBatch(self, imgs):
+		n = len(imgs)
+		if n == 0:
+			return imgs.copy()
+		ys, xs = np.mgrid[0:self.SZ, 0:self.SZ].astype(np.float64)
+		weights = imgs.astype(np.float64)
+		m00 = weights.sum(axis=(1,2))
+		nonzero = m00 > 0
+		m00[~nonzero] = 1
+		cx = (weights * xs).sum(axis=(1,2)) / m00
+		cy = (weights * ys).sum(axis=(1,2)) / m00
+		dx = xs - cx[:, None, None]
+		dy = ys - cy[:, None, None]
+		mu11 = (weights * dx * dy).sum(axis=(1,2))
+		mu02 = (weights * dy * dy).sum(axis=(1,2))
+
+		# Images without vertical spread are left as they are
+		skewed = nonzero & (np.abs(mu02) >= 1e-2)
+		skew = np.zeros(n)
+		skew[skewed] = mu11[skewed] / mu02[skewed]
+
+		# Each destination pixel (x, y) samples the source at (x + skew*(y - SZ/2), y).
+		# The sample positions are rounded to 1/32 of a pixel the same way warpAffine
+		# rounds them, so the result matches deskew() exactly.
+		m1 = skew.astype(np.float32).astype(np.float64)
+		m2 = (-0.5*self.SZ*skew).astype(np.float32).astype(np.float64)
+		row = np.rint((m1[:, None]*ys[None, :, 0] + m2[:, None])*1024).astype(np.int32) + 16
+		fixed_x = (row[:, :, None] + np.rint(xs[0]*1024).astype(np.int32)[None, None, :]) >> 5
+		map_x = np.int16(fixed_x >> 5)
+		map_weights = np.uint16(fixed_x & 31)
+
+		# remap takes images of under 32767 rows, so the stack is split into chunks,
+		# each offset down the stack to its own image, so images never sample each other
+		deskewed = np.empty_like(imgs)
+		chunk = 32767 / self.SZ
+		for start in range(0, n, chunk):
+			end = min(start + chunk, n)
+			rows = (end - start) * self.SZ
+			map_y = np.int16(ys[None] + (np.arange(end - start) * self.SZ)[:, None, None])
+			map_xy = np.dstack((map_x[start:end].reshape(rows, self.SZ), map_y.reshape(rows, self.SZ)))
+			deskewed[start:end] = cv2.remap(imgs[start:end].reshape(rows, self.SZ), map_xy,
+			                                map_weights[start:end].reshape(rows, self.SZ),
+			                                cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0).reshape(end - start, self.SZ, self.SZ)
+		deskewed[~skewed] = imgs[~skewed]
+		return deskewed
+
 	def hog(self, img):
 		gx = cv2.Sobel(img, cv2.CV_32F, 1, 0)
 		gy = cv2.Sobel(img, cv2.CV_32F, 0, 1)
@@ -131,7 +229,34 @@ class OCR:
 		return hist
 
 
+	# hog for an (N, SZ, SZ) stack of images, returned as an (N, 64) float32 array.
+	# Each image gets its own reflected border, so the whole stack can go through
+	# one Sobel and one cartToPolar as a single tall image.
+	def hogBatch(self, imgs):
+		n = len(imgs)
+		if n == 0:
+			return np.zeros((0, 4*self.bin_n), np.float32)
+		size = self.SZ + 2
+		padded = np.pad(imgs, ((0,0),(1,1),(1,1)), mode='reflect').reshape(n*size, size)
+		gx = cv2.Sobel(padded, cv2.CV_32F, 1, 0).reshape(n, size, size)[:, 1:-1, 1:-1]
+		gy = cv2.Sobel(padded, cv2.CV_32F, 0, 1).reshape(n, size, size)[:, 1:-1, 1:-1]
+		mag, ang = cv2.cartToPolar(gx.reshape(n*self.SZ, self.SZ), gy.reshape(n*self.SZ, self.SZ))
+		mag = mag.reshape(n, self.SZ, self.SZ)
+		ang = ang.reshape(n, self.SZ, self.SZ)
+
+		# quantizing binvalues in (0...16)
+		bins = np.minimum(np.int32(self.bin_n*ang/(2*np.pi)), self.bin_n-1)
+
+		# Sub-square of each pixel, in the same order as hog()
+		half = self.SZ / 2
+		ys, xs = np.mgrid[0:self.SZ, 0:self.SZ]
+		cells = (ys >= half) + 2*(xs >= half)
+
+		index = (np.arange(n)[:, None, None]*4 + cells[None])*self.bin_n + bins
+		hists = np.bincount(index.ravel(), mag.ravel(), n*4*self.bin_n)
+		return np.float32(hists.reshape(n, 4*self.bin_n))
+
+
 if __name__ == '__main__':
-	ocr = OCR()
-	ocr.processTrainingImage()
-	ocr.saveData()
+	from OCRModels import buildModel
+	buildModel(OCR)
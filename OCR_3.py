@@ -0,0 +1,127 @@
+import numpy as np
+import OCR_1
+
+# Summary
+# -------
+# Digit OCR using kNN on compact, quantized features
+#
+# Uses the same features as OCR_1 (pixel values of the resized and deskewed
+# character), reduced by PCA to their main components, and stored as int8.
+# The nearest neighbours of a whole batch of characters are found with one
+# NumPy distance computation, instead of searching the raw 400 pixel features.
+#
+# The model is a single .npy file, memory-mapped when loaded, so worker
+# processes share its pages instead of each holding a copy. Only the codes
+# are copied, once, to the float32 matrix the distances are computed with.
+#
+# Usage
+# -----
+# Run this python file to generate data file
+#
+# Use loadData() to load data file, or OCRModels.getOCR(OCR) for the model shared by the whole process
+# Use recognizeCharacter() to recognize a character, by passing in a digit cropped to bounding rectangle.
+# Use recognizeCharacterWithConfidence() to also get how sure the recognition is (0 to 1).
+# Use recognizeCharacters() to recognize a list of characters at once.
+#
+
+class OCR(OCR_1.OCR):
+	model = None
+
+	# Files used by OCRModels. Bump model_version when the features change, so saved models are rebuilt.
+	model_filename = 'knn_pca_digit_data_3.npy'
+	model_version = 1
+
+	# Number of principal components kept, and of neighbours voting on each character
+	components = 32
+	k = 5
+
+	# Trains as OCR_1 does, then reduces and quantizes the training features
+	def processTrainingImage(self):
+		OCR_1.OCR.processTrainingImage(self)
+
+		data = np.float32(self.train_data)
+		mean = data.mean(axis=0)
+		centered = data - mean
+
+		# Principal axes, from the covariance's eigenvectors of largest eigenvalue
+		_, vectors = np.linalg.eigh(np.dot(centered.T, centered))
+		components = np.float32(vectors[:, ::-1][:, :self.components].T)
+
+		# One scale for every component, so distances between codes stay proportional
+		projected = np.dot(centered, components.T)
+		scale = np.abs(projected).max() / 127.0
+		codes = np.int8(np.round(projected / scale))
+
+		count = len(codes)
+		model = np.zeros(1, self.modelType(count))
+		model['mean'][0] = mean
+		model['components'][0] = components
+		model['norms'][0] = (np.float32(codes) ** 2).sum(axis=1)
+		model['scale'][0] = scale
+		model['codes'][0] = codes
+		model['labels'][0] = self.train_labels
+		self.setModel(model)
+
+
+	# Layout of the model file: one record holding every array, so the whole model is one memory-mappable file.
+	# The float32 fields come first, to keep them aligned.
+	def modelType(self, count):
+		return np.dtype([('mean', np.float32, (self.SZ*self.SZ,)),
+		                 ('components', np.float32, (self.components, self.SZ*self.SZ)),
+		                 ('norms', np.float32, (count,)),
+		                 ('scale', np.float32),
+		                 ('codes', np.int8, (count, self.components)),
+		                 ('labels', np.uint8, (count,))])
+
+
+	# Keeps views of the model's fields, which stay in the memory-mapped file when loaded.
+	# The codes are also converted to float32 here, once, for the distance computation.
+	def setModel(self, model):
+		self.model = model
+		self.mean = model['mean'][0]
+		self.projection = model['components'][0]
+		self.norms = model['norms'][0]
+		self.scale = float(model['scale'][0])
+		self.codes = model['codes'][0]
+		self.codeMatrix = np.ascontiguousarray(np.float32(self.codes).T)
+		self.labels = model['labels'][0]
+
+
+	def saveData(self):
+		np.save(self.model_filename, self.model)
+
+
+	def loadData(self):
+		self.setModel(np.load(self.model_filename, mmap_mode='r'))
+
+
+	# Recognizes many characters with one distance computation.
+	# imgs is a list of characters cropped to their bounding rectangles, from one grid or many.
+	# Returns an array of the characters, and an array of the fraction of the nearest neighbours that agree.
+	def recognizeCharacters(self, imgs):
+		if len(imgs) == 0:
+			return np.zeros(0, np.float32), np.zeros(0, np.float32)
+		features = np.float32([self.feature(img) for img in imgs])
+
+		# Characters are projected into code units but not rounded, so only the training side loses precision
+		queries = np.dot(features - self.mean, self.projection.T) / np.float32(self.scale)
+
+		# Squared distance to every training character, leaving out |q|^2 as it is the same for each
+		distances = self.norms - 2 * np.dot(queries, self.codeMatrix)
+
+		# The k nearest, closest first
+		nearest = np.argpartition(distances, self.k, axis=1)[:, :self.k]
+		rows = np.arange(len(imgs))[:, None]
+		nearest = nearest[rows, np.argsort(distances[rows, nearest], axis=1)]
+		neighbours = self.labels[nearest]
+
+		# Most common label among the neighbours, ties going to the nearest neighbour's
+		votes = (neighbours[:, :, None] == np.arange(10)).sum(axis=1) + 0.5 * (neighbours[:, :1] == np.arange(10))
+		results = votes.argmax(axis=1)
+		confidences = (neighbours == results[:, None]).sum(axis=1) / float(self.k)
+		return np.float32(results), np.float32(confidences)
+
+
+if __name__ == '__main__':
+	from OCRModels import buildModel
+	buildModel(OCR)
@@ -47,16 +47,158 @@ empty = [
     [0, 0, 0, 0, 0, 0, 0, 0, 0]
 ]
 
-hdiv = "+-----------------------+"
+# 16x16 puzzle (box size 4)
+board16 = [
+    [ 0,  0,  4,  0,  0,  3,  7, 14,  0,  0,  1,  6,  5,  0,  0,  0],
+    [ 0, 11,  1,  6,  0,  0, 16,  2,  9,  8,  4,  0,  3, 15, 14,  0],
+    [ 0, 15,  3,  0, 11,  1, 12,  6, 16, 13,  5,  0,  0,  8, 10,  0],
+    [16,  0,  0,  0,  8,  4,  9,  0,  0,  0,  0, 14,  1, 11,  6, 12],
+    [ 0,  5,  8,  0,  0,  0, 10,  0,  0,  3,  0,  0,  0,  1,  0,  0],
+    [ 6,  0,  0,  0,  0,  0,  0,  0,  0,  4, 15,  0, 11,  3,  0,  0],
+    [ 0,  4,  0,  7,  3, 11,  0, 12,  6,  1,  0, 16,  0,  5,  0,  2],
+    [ 0,  0, 11, 12,  0, 13,  0, 16,  2,  0,  0,  0, 15,  0,  7, 10],
+    [11,  0, 16,  1,  2,  9,  0,  0,  0, 10,  0,  0,  0, 14,  0,  0],
+    [ 0,  2,  9,  0,  0,  0,  8,  4,  0,  0, 12,  3, 16,  0,  1, 11],
+    [ 0, 14,  0,  3,  0,  0, 11,  0, 13,  2,  9,  0,  0,  0,  4,  8],
+    [ 8, 10,  0,  4,  0,  0,  0,  3, 11,  6,  0,  1,  9,  0,  5,  0],
+    [ 0,  0, 10,  8,  7,  0,  0, 15,  3,  0,  6,  0,  0, 16,  0,  0],
+    [ 3,  0,  0,  0,  0,  2,  0, 13,  0,  9, 10,  0,  0,  0,  0,  4],
+    [ 0,  0, 14,  0, 12,  0,  0,  0,  1, 16,  2,  0,  0,  9,  8,  5],
+    [ 1, 16,  0, 13,  0,  0,  0,  0,  4,  0, 14, 15,  6,  0,  0,  0]
+]
+
+# 25x25 puzzle (box size 5)
+board25 = [
+    [ 0,  6,  0, 19,  0,  0, 11,  0,  1, 14,  0,  0,  3, 20, 23,  0,  0,  0, 16,  0, 13,  0, 21,  0,  0],
+    [14,  0,  0, 24,  0,  0, 20,  0,  0,  0, 25,  7,  0,  0,  0, 12,  6, 19,  8, 17, 16,  5,  4,  0, 15],
+    [ 0,  0, 10, 21,  0,  5,  0,  4,  0, 15,  0,  6, 12,  0, 19,  0,  0,  0,  0,  0, 11,  9, 24,  1, 14],
+    [ 0,  2,  0, 23, 20,  7, 13,  0, 10, 25,  0,  0, 18,  0,  4,  0,  0,  0,  0,  0,  8,  6,  0, 12,  0],
+    [15,  5, 18,  4, 16,  6,  0, 19, 12,  0,  0,  9,  0, 11, 24, 10,  0, 21,  0,  0, 20,  0,  0,  3, 22],
+    [ 0,  1, 24, 14,  0,  3,  0,  0,  0, 13,  0, 10,  0,  7,  0, 19, 12,  0,  0,  0,  0, 18, 15,  4,  8],
+    [ 0, 10, 21, 25,  7,  0,  5, 15,  0,  8, 11, 12, 19,  6, 17,  0,  0, 22,  0, 13,  9,  1, 14, 24,  0],
+    [ 0,  3,  0, 22,  0,  0,  7, 25, 21,  0,  0,  0,  4,  5, 15, 24,  0, 14,  9, 20,  0, 12, 17,  0, 11],
+    [11, 12, 19, 17,  6,  1,  0, 14,  0, 20, 13,  0, 23,  2, 22,  4, 18, 15,  5,  8,  0, 10, 25, 21, 16],
+    [ 0, 18,  4, 15,  5, 12,  0, 17, 19, 11, 20,  1,  0,  9, 14, 21, 10, 25,  0, 16,  2,  0, 22, 23,  0],
+    [19,  0,  6, 12,  0, 11, 17,  0,  9,  0,  0, 20,  2, 14,  3,  5, 16,  0,  0,  4,  0,  0, 10,  0, 21],
+    [24, 11,  9,  1, 17,  0,  0,  0,  2,  0,  0, 13,  7,  0, 10,  0,  8, 12,  0, 19, 25, 16, 18,  0,  4],
+    [ 0, 13,  7, 10,  0, 16,  0, 18,  0,  4, 19,  8,  6,  0,  0,  2,  0,  0, 14,  0, 17,  0,  0,  0,  0],
+    [ 4,  0,  5,  0, 25,  8, 15, 12,  6,  0,  0,  0,  0, 17,  0,  0, 13,  0, 22, 21, 14, 20,  0,  2, 23],
+    [23, 20,  2,  3, 14, 13, 22, 10,  7,  0,  4, 16,  0,  0,  0,  9,  0,  1, 17,  0, 15,  0,  0,  0,  0],
+    [ 5, 21, 25, 16, 10,  0, 18,  0,  0,  6,  0,  0, 17,  0,  0,  0,  0, 13,  0,  0,  0,  0, 20,  0,  0],
+    [ 6,  0,  0,  8, 18, 19,  0, 11, 17,  0,  2, 24,  0,  1,  0, 25, 21,  0, 10,  5,  3, 23, 13, 22,  7],
+    [ 7, 23, 22,  0,  0, 21,  0, 16, 25,  5,  0,  0, 15,  0,  0,  0,  0,  0,  1,  0, 12, 19,  0, 17,  0],
+    [ 9, 19,  0, 11,  0,  0,  1, 20, 14,  2,  7,  0, 22,  0,  0,  0,  0,  0,  0,  0, 10, 21, 16, 25,  5],
+    [ 2,  0,  0, 20,  1,  0,  0,  0, 22,  7,  0, 21, 25, 10, 16,  0, 19, 11,  0,  9, 18,  4,  0, 15,  0],
+    [ 0, 15,  8,  6,  4, 17, 19,  0, 11,  1,  3, 14,  0,  0,  0, 16, 25,  0, 21, 18, 23, 22,  0,  0, 10],
+    [ 3,  0, 20,  2, 24, 22, 23,  7, 13,  0, 18,  0, 16,  0,  0, 11,  0,  9, 19,  0,  4, 15,  6,  8, 12],
+    [ 0, 22,  0,  0, 23,  0, 21,  5,  0,  0, 12, 15,  0,  4,  6, 20, 14,  0,  0,  3,  0,  0,  9,  0,  0],
+    [ 0,  0, 16,  0, 21, 15,  4,  0,  8,  0,  0, 17,  0,  0,  9, 13, 22,  7, 23, 10,  0,  0,  2, 20,  0],
+    [ 1, 17, 11,  9, 19,  0,  0,  0, 20,  0, 10,  0, 13, 23,  0,  8,  0,  0,  0, 12, 21,  0,  5, 16,  0]
+]
+
+# Graded puzzle corpus, from easy to the hardest known, used by SudokuBenchmark.
+# Puzzles are 81 character strings in row-major order, with 0 or . for empty cells.
+# Every puzzle here has exactly one solution.
+grades = ['easy', 'medium', 'hard', 'hardest', 'seventeen']
+
+graded = {
+    # Solved by naked and hidden singles alone
+    'easy': [
+        "003020600900305001001806400008102900700000008006708200002609500800203009005010300",
+        "200080300060070084030500209000105408000000000402706000301007040720040060004010003",
+        "000000907000420180000705026100904000050000040000507009920108000034059000507000000",
+        "030050040008010500460000012070502080000603000040109030250000098001020600080060020",
+        "020810740700003100090002805009040087400208003160030200302700060005600008076051090",
+        "480006902002008001900370060840010200003704100001060049020085007700900600609200018",
+        "000900002050123400030000160908000000070000090000000205091000050007439020400007000",
+    ],
+    # Also need the other propagation techniques, but no search
+    'medium': [
+        "100920000524010000000000070050008102000000000402700090060000000000030945000071006",
+        "043080250600000000000001094900004070000608000010200003820500000000000005034090710",
+        "001900003900700160030005007050000009004302600200000070600100030042007006500006800",
+        "4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......",
+        "52...6.........7.13...........4..8..6......5...........418.........3..2...87.....",
+        "6.....8.3.4.7.................5.4.7.3..2.....1.6.......2.....5.....8.6......1....",
+        "......52..8.4......3...9...5.1...6..2..7........3.....6...1..........7.4.......3.",
+    ],
+    # Need search even with every propagation technique
+    'hard': [
+        "..9748...7.........2.1.9.....7...24..64.1.59..98...3.....8.3.2.........6...2759..",
+        "48.3............71.2.......7.5....6....2..8.............1.76...3.....4......5....",
+        "....14....3....2...7..........9...3.6.1.............8.2.....1.4....5.6.....7.8...",
+        "6.2.5.........3.4..........43...8....1....2........7..5..27...........81...6.....",
+        ".524.........7.1..............8.2...3.....6...9.5.....1.6.3...........897........",
+        "6.2.5.........4.3..........43...8....1....2........7..5..27...........81...6.....",
+        ".923.........8.1...........1.7.4...........658.........6.5.2...4.....7.....9.....",
+    ],
+    # Puzzles published as among the hardest known, including Arto Inkala's and Easter Monster
+    'hardest': [
+        "85...24..72......9..4.........1.7..23.5...9...4...........8..7..17..........36.4.",
+        "..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..",
+        "12..4......5.69.1...9...5.........7.7...52.9..3......2.9.6...5.4..9..8.1..3...9.4",
+        "...57..3.1......2.7...234......8...4..7..4...49....6.5.42...3.....7..9....18.....",
+        "7..1523........92....3.....1....47.8.......6............9...5.6.4.9.7...8....6.1.",
+        "1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..",
+        "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..",
+        "..............3.85..1.2.......5.7.....4...1...9.......5......73..2.1........4...9",
+        "1.......2.9.4...5...6...7...5.9.3.......7.......85..4.7.....6...3...9.8...2.....1",
+    ],
+    # 17-clue puzzles, the fewest clues a unique puzzle can have
+    'seventeen': [
+        "000000010400000000020000000000050407008000300001090000300400200050100000000806000",
+        "000000010400000000020000000000050604008000300001090000300400200050100000000807000",
+        "000000012000035000000600070700000300000400800100000000000120000080000040050000600",
+        "000000012003600000000007000410020000000500300700000600280000040000300500000000000",
+        "000000012008030000000000040120500000000004700060000000507000300000620000000100000",
+        "000000013000030080070000000000206000030000900000010000600500204000400700100000000",
+        "000000013000200000000000080000760200008000400010000000200000750600340000000008000",
+        "000000013000500070000802000000400900107000000000000200890000050040000600000010000",
+        "000000013000700060000508000000400800106000000000000200740000050020000400000010000",
+        "000000013000700060000509000000400900106000000000000200740000050080000400000010000",
+    ],
+}
+
+# Parses a puzzle from an 81 character string, with 0 or . for empty cells.
+# Returns None if the string is not a puzzle.
+def parse(text):
+    if len(text) != 81:
+        return None
 
-row = "| {0} {1} {2} | {3} {4} {5} | {6} {7} {8} |"
+    cells = []
+    for ch in text:
+        if ch == '.' or ch == '0':
+            cells.append(0)
+        elif '1' <= ch <= '9':
+            cells.append(int(ch))
+        else:
+            return None
 
+    return [cells[y*9:y*9+9] for y in range(0, 9)]
+
+# Formats a puzzle as an 81 character string, with 0 for empty cells, as parse() reads it
+def format(puzzle):
+    return ''.join(str(num) for row in puzzle for num in row)
+
+# Formats a puzzle as text, with lines between boxes.
+# Works for any box size, e.g. 9x9 or 16x16 puzzles.
 def prettify(puzzle):
+    size = len(puzzle)
+    box = int(round(size ** 0.5))
+    width = len(str(size))
+
+    def formatRow(values):
+        cells = [str(v).rjust(width) for v in values]
+        boxes = [' '.join(cells[i:i+box]) for i in range(0, size, box)]
+        return '| ' + ' | '.join(boxes) + ' |'
+
+    hdiv = '+' + '-' * (len(formatRow(puzzle[0])) - 2) + '+'
+
     stuff = []
-    for i in range(0, 9, 3):
+    for i in range(0, size, box):
         stuff.append(hdiv)
-        for j in range(0, 3):
-            stuff.append(row.format(*puzzle[i+j]))
+        for j in range(0, box):
+            stuff.append(formatRow(puzzle[i+j]))
     stuff.append(hdiv)
     return '\n'.join(stuff)
 
@@ -1,22 +1,51 @@
 
+import time
 import Puzzles
+from SudokuTables import getTables
+from SudokuMetrics import report, timedSearch
 
+# Copies a grid into new lists of rows. Rows of a numpy array slice into views,
+# so each row is copied with list() rather than row[:].
 def copyList(xs):
-    return [row[:] for row in xs]
+    return [list(row) for row in xs]
 
 
 class SudokuBacktrackingSolver:
+
+    # Number of values placed by the last search, and of cells it ran out of values for
+    nodes = 0
+    backtracks = 0
+
+    # boxSize sets the size of the board, 3 for 9x9 boards, 4 for 16x16, 5 for 25x25
+    # sink is given a record of each search (see SudokuMetrics)
+    def __init__(self, boxSize=3, sink=None):
+        self.box = boxSize
+        self.size = boxSize * boxSize
+        self.tables = getTables(boxSize)
+        self.sink = sink
     
     # puzzle should be a 9x9 array, with 0 representing empty cells,
     # and 1-9 representing fixed values in the puzzle.
+    # (or 16x16 with 1-16, and so on, for larger box sizes)
     # Solves a puzzle represented as a 2D array.
 
     # The limit parameter controls how many solutions to find
     # (-1 being as many as possible)
 
-    def solve(self, puzzle, limit=-1):
+    # With mrv set, the most constrained empty cell is tried first
+    # instead of walking the cells in row-major order.
+
+    def solve(self, puzzle, limit=-1, mrv=False):
 
+        if mrv:
+            return self.solveMRV(puzzle, limit)
+
+        start = time.time()
         solutions = []
+        size = self.size
+        boxSize = self.box
+        self.nodes = 0
+        self.backtracks = 0
 
         def enoughSolutions():
             if limit == -1:
@@ -27,28 +56,28 @@ class SudokuBacktrackingSolver:
         # Checks if num may be legally placed at cell (x, y)
         def check(x, y, num):
             # Check row
-            for xx in range(0, 9):
+            for xx in range(0, size):
                 if xx != x and puzzle[y][xx] == num:
                     return False
 
             # Check column
-            for yy in range(0, 9):
+            for yy in range(0, size):
                 if yy != y and puzzle[yy][x] == num:
                     return False
 
             # Check box
             # First determine the top-left coordinates of the box we're in
-            bx = int(x / 3) * 3
-            by = int(y / 3) * 3
+            bx = int(x / boxSize) * boxSize
+            by = int(y / boxSize) * boxSize
 
             # Get contents of the box (in row-major representation)
-            box2d = map(lambda a: a[bx:bx+3], puzzle[by:by+3])
+            box2d = map(lambda a: a[bx:bx+boxSize], puzzle[by:by+boxSize])
             box = sum(box2d, [])
 
             # Determine this cell's position in the box so we can avoid checking it
-            bpx = x % 3
-            bpy = y % 3
-            posInBox = bpx + bpy * 3
+            bpx = x % boxSize
+            bpy = y % boxSize
+            posInBox = bpx + bpy * boxSize
 
             for i, b in enumerate(box):
                 if i != posInBox and b == num:
@@ -56,42 +85,208 @@ class SudokuBacktrackingSolver:
 
             return True
 
-        def helper(x, y):
-            
-            if enoughSolutions():
-                return
+        # Empty cells, in row-major order
+        empties = [(x, y) for y in range(0, size) for x in range(0, size) if puzzle[y][x] == 0]
 
-            if y == 9:
-                # Making it here means we have a valid answer
-                solutions.append(copyList(puzzle))
-                return
+        # Walk the empty cells iteratively, so large boards do not hit the recursion limit.
+        # Each cell holds the value being tried for it, so no other state is needed.
+        try:
+            i = 0
+            while i >= 0 and not enoughSolutions():
+                if i == len(empties):
+                    # Making it here means we have a valid answer
+                    solutions.append(copyList(puzzle))
+                    i -= 1
+                    continue
 
-            # Compute coordinates of next cell (moving right, wrapping on rows)
-            nx = (x+1) % 9
-            ny = y+1 if x == 8 else y
+                # Try the values after the one currently in this cell
+                x, y = empties[i]
+                n = puzzle[y][x] + 1
+                while n <= size and not check(x, y, n):
+                    n += 1
 
-            # If the current cell is empty, try all possible values for it
-            if puzzle[y][x] == 0:
-                for n in range(1, 10):
+                # Branch from this cell only if consistent, otherwise
+                # prune search tree
+                if n <= size:
                     puzzle[y][x] = n
+                    self.nodes += 1
+                    i += 1
+                else:
+                    # We've exhausted all values for this cell.
+                    # Reset it so it'll be in a fresh state when we backtrack and come back to it
+                    puzzle[y][x] = 0
+                    self.backtracks += 1
+                    i -= 1
+        finally:
+            # Leave the puzzle as it was given, if we stopped early or were interrupted
+            for x, y in empties:
+                puzzle[y][x] = 0
 
-                    # Branch from this cell only if consistent, otherwise
-                    # prune search tree
-                    if check(x, y, n):
-                        helper(nx, ny)
+        report(self.sink, 'backtracking.search', time.time() - start, nodes=self.nodes, backtracks=self.backtracks)
+        return solutions
 
-                # We've exhausted all values for this cell.
-                # Reset it so it'll be in a fresh state when we backtrack and come back to it
-                puzzle[y][x] = 0
 
-            # Otherwise proceed to the next cell, not branching
-            else:
-                helper(nx, ny)
+    def solveMRV(self, puzzle, limit=-1):
+
+        solutions = []
+
+        for solution in self.iter_solutions(puzzle):
+            solutions.append(solution)
+
+            if limit != -1 and len(solutions) >= limit:
+                break
 
-        helper(0, 0)
         return solutions
 
 
+    # Yields each solution as soon as it is found, using the MRV search.
+    # Solutions are only kept by the caller, and the search stops when the caller stops iterating.
+    def iter_solutions(self, puzzle):
+        t = self.tables
+
+        for empties, placed in self.timedSearchMRV(puzzle):
+            solution = copyList(puzzle)
+            for i in range(0, len(empties)):
+                cell = empties[i]
+                solution[t.ROW_OF[cell]][t.COL_OF[cell]] = t.BIT_DIGIT[placed[i]]
+            yield solution
+
+
+    # Counts solutions without building any of them, stopping once cap
+    # solutions are found (-1 to count them all)
+    def count_solutions(self, puzzle, cap=-1):
+        count = 0
+        for _ in self.timedSearchMRV(puzzle):
+            count += 1
+            if count == cap:
+                break
+        return count
+
+
+    # A puzzle is unique if it has exactly one solution.
+    # Search stops as soon as a second solution is found.
+    def is_unique(self, puzzle):
+        return self.count_solutions(puzzle, 2) == 1
+
+
+    # searchMRV, reported to the sink once it finishes or is stopped
+    def timedSearchMRV(self, puzzle):
+        search = self.searchMRV(puzzle)
+        if self.sink is None:
+            return search
+        return timedSearch(self.sink, 'mrv.search', search,
+                           lambda: {'nodes': self.nodes, 'backtracks': self.backtracks})
+
+
+    # Search that always branches on the empty cell with the fewest legal values.
+    # Digits used in each row, column and box are kept as bitmasks, updated in
+    # place when a value is placed or undone. The search is iterative, and all
+    # of its state is allocated up front, so nothing is allocated per node.
+
+    # Yields once per solution, as the empty cells (in the order they were filled)
+    # and the bits placed in them. Both lists belong to the search and are
+    # changed once it resumes, so copy anything that needs to be kept.
+    def searchMRV(self, puzzle):
+
+        t = self.tables
+        ALL, BIT, BIT_COUNT = t.ALL, t.BIT, t.BIT_COUNT
+        ROW_OF, COL_OF, BOX_OF = t.ROW_OF, t.COL_OF, t.BOX_OF
+
+        rows = [0] * self.size
+        cols = [0] * self.size
+        boxes = [0] * self.size
+        empties = []
+        self.nodes = 0
+        self.backtracks = 0
+
+        for cell in range(0, t.CELLS):
+            num = puzzle[ROW_OF[cell]][COL_OF[cell]]
+            if num == 0:
+                empties.append(cell)
+                continue
+
+            # Fixed values that clash leave nothing to search
+            bit = BIT[num]
+            if (rows[ROW_OF[cell]] | cols[COL_OF[cell]] | boxes[BOX_OF[cell]]) & bit:
+                return
+            rows[ROW_OF[cell]] |= bit
+            cols[COL_OF[cell]] |= bit
+            boxes[BOX_OF[cell]] |= bit
+
+        # empties[:depth] are the cells filled so far, in the order they were chosen.
+        # untried[depth] holds the values not yet tried for the cell at that depth,
+        # and placed[depth] the bit of the value currently placed there.
+        total = len(empties)
+        untried = [0] * total
+        placed = [0] * total
+
+        depth = 0
+        nodes = 0
+        backtracks = 0
+        forward = True
+        while True:
+            if forward:
+                if depth == total:
+                    # Making it here means we have a valid answer
+                    self.nodes = nodes
+                    self.backtracks = backtracks
+                    yield empties, placed
+                    forward = False
+                    continue
+
+                # Find the remaining cell with the fewest legal values
+                best = depth
+                bestCount = self.size + 1
+                bestFree = 0
+                i = depth
+                while i < total:
+                    cell = empties[i]
+                    free = ALL & ~(rows[ROW_OF[cell]] | cols[COL_OF[cell]] | boxes[BOX_OF[cell]])
+                    count = BIT_COUNT[free]
+                    if count < bestCount:
+                        best = i
+                        bestCount = count
+                        bestFree = free
+                        if count <= 1:
+                            break
+                    i += 1
+
+                empties[depth], empties[best] = empties[best], empties[depth]
+                untried[depth] = bestFree
+            else:
+                if depth == 0:
+                    break
+                # Undo the value placed at the previous depth
+                depth -= 1
+                cell = empties[depth]
+                bit = placed[depth]
+                rows[ROW_OF[cell]] ^= bit
+                cols[COL_OF[cell]] ^= bit
+                boxes[BOX_OF[cell]] ^= bit
+
+            free = untried[depth]
+            if free == 0:
+                # We've exhausted all values for this cell, backtrack
+                backtracks += 1
+                forward = False
+                continue
+
+            # Place the lowest untried value
+            bit = free & -free
+            untried[depth] = free ^ bit
+            placed[depth] = bit
+            cell = empties[depth]
+            rows[ROW_OF[cell]] |= bit
+            cols[COL_OF[cell]] |= bit
+            boxes[BOX_OF[cell]] |= bit
+            depth += 1
+            nodes += 1
+            forward = True
+
+        self.nodes = nodes
+        self.backtracks = backtracks
+
+
 
 #
 #   Main Entry Point
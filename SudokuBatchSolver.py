@@ -0,0 +1,132 @@
+import numpy as np
+import Puzzles
+from SudokuTables import ALL, BIT, BIT_COUNT, BIT_DIGIT, UNITS, PEERS
+from SudokuDLXSolver import SudokuDLXSolver
+
+# Summary
+# -------
+# Solves many puzzles at once.
+#
+# Puzzles are passed as an (N, 9, 9) uint8 array, with 0 for empty cells.
+# Candidates are kept as one bitmask per cell (see SudokuTables), in an (N, 81)
+# uint16 array. Candidate elimination and naked/hidden single propagation run
+# on all puzzles together as numpy operations, repeated until no puzzle changes.
+# Only puzzles that propagation cannot finish are searched one at a time, by
+# SudokuDLXSolver starting from their propagated candidates.
+#
+# Usage
+# -----
+# solutions, solved = solve_batch(puzzles)
+# solved[i] is False when puzzle i has no solution, in which case
+# solutions[i] is left as the puzzle itself.
+#
+
+UNIT_CELLS = np.array(UNITS)
+
+# The 20 peers of each cell, as an (81, 20) index
+PEER_CELLS = np.array(PEERS)
+
+# Bitmask of each value (0 for empty), and the digit of each single-bit mask (0 otherwise)
+VALUE_BIT = np.array(BIT, np.uint16)
+MASK_COUNT = np.array(BIT_COUNT, np.uint8)
+MASK_DIGIT = np.zeros(ALL + 1, np.uint8)
+for mask, digit in BIT_DIGIT.items():
+    MASK_DIGIT[mask] = digit
+
+
+# Solves an (N, 9, 9) array of puzzles.
+# Puzzles are propagated chunk_size at a time, to bound memory use.
+def solve_batch(puzzles, chunk_size=10000):
+    puzzles = np.asarray(puzzles, np.uint8).reshape(-1, 81)
+    count = len(puzzles)
+
+    values = puzzles.copy()
+    candidates = np.zeros((count, 81), np.uint16)
+    failed = np.zeros(count, np.bool_)
+    for start in range(0, count, chunk_size):
+        end = min(start + chunk_size, count)
+        values[start:end], candidates[start:end], failed[start:end] = propagate(values[start:end])
+
+    # Search whatever propagation left unfinished, with only the candidates propagation left
+    solved = ~failed & (values != 0).all(axis=1)
+    for i in np.nonzero(~failed & ~solved)[0]:
+        masks = np.where(values[i] != 0, VALUE_BIT[values[i]], candidates[i]).tolist()
+        solutions = SudokuDLXSolver().solve(values[i].reshape(9, 9).tolist(), 1, masks)
+        if len(solutions) > 0:
+            values[i] = np.array(solutions[0], np.uint8).ravel()
+            solved[i] = True
+
+    values[~solved] = puzzles[~solved]
+    return values.reshape(-1, 9, 9), solved
+
+
+# Repeatedly fills naked and hidden singles in an (N, 81) array of values.
+# Returns the filled values, the candidates of their empty cells (0 for filled
+# cells), and which puzzles were found to have no solution.
+def propagate(values):
+    values = values.copy()
+    candidates = np.zeros(values.shape, np.uint16)
+    failed = np.zeros(len(values), np.bool_)
+
+    # Puzzles that changed in the last round
+    active = np.arange(len(values))
+
+    while len(active) > 0:
+        current = values[active]
+        empty = current == 0
+
+        # Digits placed at each cell's peers, and the candidates they leave
+        bits = VALUE_BIT[current]
+        used = np.bitwise_or.reduce(bits[:, PEER_CELLS], axis=2)
+        cellCandidates = np.where(empty, ALL & ~used, 0).astype(np.uint16)
+        count = MASK_COUNT[cellCandidates]
+
+        # No solution if a value clashes with a peer, or an empty cell has no candidates
+        bad = (bits & used != 0).any(axis=1)
+        bad |= ((count == 0) & empty).any(axis=1)
+
+        # Digits that are candidates of exactly one cell of a unit, found by folding
+        # in the unit's cells one at a time, and the digits placed in each unit
+        unitCandidates = cellCandidates[:, UNIT_CELLS]
+        once = np.zeros(unitCandidates.shape[:2], np.uint16)
+        many = np.zeros(unitCandidates.shape[:2], np.uint16)
+        for position in range(0, 9):
+            masks = unitCandidates[:, :, position]
+            many |= once & masks
+            once |= masks
+        placed = np.bitwise_or.reduce(bits[:, UNIT_CELLS], axis=2)
+        hidden = once & ~many
+
+        # No solution if a digit has nowhere left to go in some unit
+        bad |= ((once | placed) != ALL).any(axis=1)
+
+        # Naked singles: cells with only one candidate
+        new = np.where(count == 1, MASK_DIGIT[cellCandidates], 0).astype(np.uint8)
+
+        # Hidden singles: digits with only one possible cell in a unit. A cell that
+        # is the only place for two digits means there is no solution.
+        for position in range(0, 9):
+            found = unitCandidates[:, :, position] & hidden
+            p, unit = np.nonzero(found)
+            digits = MASK_DIGIT[found[p, unit]]
+            bad[p[digits == 0]] = True
+            new[p, UNIT_CELLS[unit, position]] = digits
+
+        failed[active[bad]] = True
+        changed = ~bad & (new != 0).any(axis=1)
+        values[active[changed]] = current[changed] + new[changed]
+        candidates[active] = cellCandidates
+        active = active[changed]
+
+    return values, candidates, failed
+
+
+
+#
+#   Main Entry Point
+#
+if __name__ == '__main__':
+    puzzles = np.array([Puzzles.oneSolution, Puzzles.image3, Puzzles.manySolutions], np.uint8)
+    solutions, solved = solve_batch(puzzles)
+    for solution in solutions:
+        Puzzles.prettyPrint(solution)
@@ -0,0 +1,255 @@
+import sys
+import json
+import time
+import signal
+import platform
+import resource
+import argparse
+import multiprocessing
+from itertools import islice
+import numpy as np
+import Puzzles
+from SudokuBacktrackingSolver import SudokuBacktrackingSolver, copyList
+from SudokuConstraintSolver import SudokuConstraintSolver
+from SudokuDLXSolver import SudokuDLXSolver
+from SudokuBatchSolver import solve_batch
+
+# Summary
+# -------
+# Benchmarks every solver over the graded puzzle corpus in Puzzles.graded.
+#
+# For each solver and grade it reports wall time (total, mean and percentiles),
+# search nodes and propagation steps, and peak memory. Each solver and grade is
+# run in a fresh process, so peak memory is not carried over between runs.
+#
+# The batch solver is given each grade in one call, and each of its puzzles is
+# counted at the mean time per puzzle of that call.
+#
+# Puzzles that take longer than the timeout are stopped and counted as timeouts,
+# so the plain row-major backtracking solver can be included without hanging on
+# the hard grades.
+#
+# Usage
+# -----
+# python SudokuBenchmark.py -o report.json
+# python SudokuBenchmark.py --solvers dlx constraint --grades hard hardest --repeat 5
+#
+# The report is JSON, so reports from different versions can be compared.
+#
+
+REPORT_VERSION = 1
+
+# Each solver finds the first solution of a puzzle, and returns
+# (solution found, search nodes, propagation steps).
+# Counters a solver does not keep are reported as None.
+
+def runBacktracking(puzzle):
+    solver = SudokuBacktrackingSolver()
+    solutions = solver.solve(puzzle, 1)
+    return len(solutions) > 0, solver.nodes, None
+
+def runMRV(puzzle):
+    solver = SudokuBacktrackingSolver()
+    solutions = solver.solve(puzzle, 1, mrv=True)
+    return len(solutions) > 0, solver.nodes, None
+
+def runDLX(puzzle):
+    solver = SudokuDLXSolver()
+    solutions = solver.solve(puzzle, 1)
+    return len(solutions) > 0, solver.nodes, None
+
+def runConstraint(puzzle):
+    solver = SudokuConstraintSolver()
+    solutions = list(islice(solver.iter_solutions(puzzle), 1))
+    return len(solutions) > 0, solver.nodes, solver.propagations
+
+def runConstraintSingles(puzzle):
+    solver = SudokuConstraintSolver(techniques=())
+    solutions = list(islice(solver.iter_solutions(puzzle), 1))
+    return len(solutions) > 0, solver.nodes, solver.propagations
+
+# The batch solver is run over every puzzle of a grade in one call, as it is meant to be used,
+# and returns how many of them it solved
+def runBatch(puzzles):
+    solutions, solved = solve_batch(np.array(puzzles, np.uint8))
+    return int(solved.sum()), None, None
+
+SOLVERS = {
+    'backtracking': runBacktracking,
+    'mrv': runMRV,
+    'dlx': runDLX,
+    'constraint': runConstraint,
+    'constraint-singles': runConstraintSingles,
+    'batch': runBatch,
+}
+
+# Solvers given a whole grade at a time. Each puzzle is counted at the mean time of the
+# call, so their percentiles are flat and their timeout is per puzzle of the grade.
+BATCH_SOLVERS = ['batch']
+
+SOLVER_ORDER = ['backtracking', 'mrv', 'dlx', 'constraint', 'constraint-singles', 'batch']
+
+
+class PuzzleTimeout(Exception):
+    pass
+
+def raiseTimeout(signum, frame):
+    raise PuzzleTimeout()
+
+
+# Nearest-rank percentile of a sorted list
+def percentile(values, p):
+    if len(values) == 0:
+        return None
+    index = int(round(p / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+# Peak resident memory of this process so far, in KB
+def peakMemoryKB():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, OS X reports bytes
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+# Runs one solver over one grade, repeat times.
+# Runs in its own worker process.
+def benchmark(args):
+    solverName, grade, repeat, timeout = args
+    run = SOLVERS[solverName]
+    puzzles = [Puzzles.parse(text) for text in Puzzles.graded[grade]]
+
+    memoryBefore = peakMemoryKB()
+    signal.signal(signal.SIGALRM, raiseTimeout)
+
+    times = []
+    nodes = []
+    propagations = []
+    solved = 0
+    timeouts = 0
+    for _ in range(0, repeat):
+        if solverName in BATCH_SOLVERS:
+            signal.setitimer(signal.ITIMER_REAL, timeout * len(puzzles))
+            start = time.time()
+            try:
+                found, _, _ = run([copyList(puzzle) for puzzle in puzzles])
+            except PuzzleTimeout:
+                timeouts += len(puzzles)
+                continue
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+
+            times += [(time.time() - start) / len(puzzles)] * len(puzzles)
+            solved += found
+            continue
+
+        for puzzle in puzzles:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+            start = time.time()
+            try:
+                # A fresh copy, so a run stopped partway cannot leave its puzzle changed for the next
+                found, nodeCount, propagationCount = run(copyList(puzzle))
+            except PuzzleTimeout:
+                timeouts += 1
+                continue
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+
+            times.append(time.time() - start)
+            solved += found
+            if nodeCount is not None:
+                nodes.append(nodeCount)
+            if propagationCount is not None:
+                propagations.append(propagationCount)
+
+    times.sort()
+    return {
+        'solver': solverName,
+        'grade': grade,
+        'puzzles': len(puzzles) * repeat,
+        'solved': solved,
+        'timeouts': timeouts,
+        'totalSeconds': sum(times),
+        'meanSeconds': sum(times) / len(times) if times else None,
+        'p50Seconds': percentile(times, 50),
+        'p90Seconds': percentile(times, 90),
+        'p99Seconds': percentile(times, 99),
+        'maxSeconds': times[-1] if times else None,
+        'nodes': sum(nodes) if nodes else None,
+        'meanNodes': float(sum(nodes)) / len(nodes) if nodes else None,
+        'propagations': sum(propagations) if propagations else None,
+        'meanPropagations': float(sum(propagations)) / len(propagations) if propagations else None,
+        'peakMemoryKB': peakMemoryKB(),
+        'memoryGrowthKB': peakMemoryKB() - memoryBefore,
+    }
+
+
+def formatSeconds(seconds):
+    return '-' if seconds is None else '%.2fms' % (seconds * 1000)
+
+
+def printSummary(results, stream):
+    stream.write('%-20s %-10s %7s %9s %9s %9s %12s %12s %10s\n' % (
+        'solver', 'grade', 'solved', 'p50', 'p99', 'max', 'nodes', 'propagations', 'peak KB'))
+    for r in results:
+        stream.write('%-20s %-10s %3d/%-3d %9s %9s %9s %12s %12s %10d\n' % (
+            r['solver'], r['grade'], r['solved'], r['puzzles'],
+            formatSeconds(r['p50Seconds']), formatSeconds(r['p99Seconds']), formatSeconds(r['maxSeconds']),
+            '-' if r['nodes'] is None else r['nodes'],
+            '-' if r['propagations'] is None else r['propagations'],
+            r['peakMemoryKB']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sudoku solvers over a graded puzzle corpus.")
+    parser.add_argument("--solvers", nargs="+", choices=SOLVER_ORDER, default=SOLVER_ORDER,
+                        help="solvers to run (default: all)")
+    parser.add_argument("--grades", nargs="+", choices=Puzzles.grades, default=Puzzles.grades,
+                        help="puzzle grades to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of times to solve each puzzle (default: 3)")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="seconds before a puzzle is counted as a timeout (default: 10)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="file to write the JSON report to (default: stdout)")
+    args = parser.parse_args(argv)
+
+    tasks = [(solver, grade, args.repeat, args.timeout) for solver in args.solvers for grade in args.grades]
+
+    # A fresh process per task, so each measures its own peak memory
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        results = pool.map(benchmark, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    report = {
+        'version': REPORT_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'timeoutSeconds': args.timeout,
+        'results': results,
+    }
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    # The summary goes to stderr, so stdout stays valid JSON
+    printSummary(results, sys.stderr)
+
+
+
+#
+#   Main Entry Point
+#
+if __name__ == '__main__':
+    main()
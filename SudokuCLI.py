@@ -0,0 +1,104 @@
+import sys
+import argparse
+import multiprocessing
+import Puzzles
+from SudokuConstraintSolver import SudokuConstraintSolver
+from SudokuSolveCache import SudokuSolveCache
+from SudokuPool import runPool
+
+# Summary
+# -------
+# Solves puzzles streamed from a file or stdin, across a pool of processes.
+#
+# Each input line is a puzzle of 81 characters in row-major order,
+# with 0 or . for empty cells. Blank lines and lines starting with # are skipped.
+#
+# Each output line is the puzzle (with 0 for empty cells), a tab, then its
+# solution. The solution is "-" if the puzzle has none, or "invalid" if the
+# line could not be read as a puzzle.
+#
+# Usage
+# -----
+# python SudokuCLI.py puzzles.txt -o solutions.txt -p 8 --ordered
+# cat puzzles.txt | python SudokuCLI.py
+#
+# With --cache, each worker keeps the solutions of recent puzzles (see SudokuSolveCache),
+# so repeated puzzles, and their relabeled or rearranged copies, are not solved again.
+#
+
+
+# The worker's solution cache, set up by initWorker if --cache is given
+cache = None
+
+
+def initWorker(cacheSize):
+    global cache
+    if cacheSize > 0:
+        cache = SudokuSolveCache(capacity=cacheSize)
+
+
+# Solves one input line, returning the line to write out.
+# Runs in the worker processes.
+def solveLine(line):
+    puzzle = Puzzles.parse(line)
+    if puzzle is None:
+        return "%s\tinvalid" % line
+
+    if cache is not None:
+        solutions = cache.solve(puzzle)
+    else:
+        solutions = SudokuConstraintSolver().solve(puzzle)
+    if len(solutions) == 0:
+        return "%s\t-" % Puzzles.format(puzzle)
+    return "%s\t%s" % (Puzzles.format(puzzle), Puzzles.format(solutions[0]))
+
+
+# Yields puzzle lines as they are read, so input is never held in memory
+def readLines(stream):
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve sudoku puzzles, one 81 character puzzle per line.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="file to read puzzles from (default: stdin)")
+    parser.add_argument("-o", "--output", default="-",
+                        help="file to write solutions to (default: stdout)")
+    parser.add_argument("-p", "--processes", type=int, default=multiprocessing.cpu_count(),
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("-c", "--chunksize", type=int, default=64,
+                        help="number of puzzles sent to a worker at a time (default: 64)")
+    parser.add_argument("--ordered", action="store_true",
+                        help="write solutions in input order, instead of as they finish")
+    parser.add_argument("--cache", type=int, default=0,
+                        help="number of recent puzzles each worker keeps solutions of (default: 0, no cache)")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    sink = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    results = runPool(solveLine, readLines(source), args.processes, args.chunksize,
+                      args.ordered, initWorker, (args.cache,))
+    try:
+        for count, result in enumerate(results, 1):
+            sink.write(result + "\n")
+            # Flush about once per chunk, so results are written as they finish
+            if count % args.chunksize == 0:
+                sink.flush()
+    finally:
+        results.close()
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+
+
+#
+#   Main Entry Point
+#
+if __name__ == '__main__':
+    main()
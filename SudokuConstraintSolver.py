@@ -1,60 +1,126 @@
 
+import time
 import Puzzles
 import numpy as np
-import cv2
-from SudokuExtractor import SudokuExtractor
-from SudokuBacktrackingSolver import SudokuBacktrackingSolver
+from itertools import combinations, islice
+from SudokuDLXSolver import SudokuDLXSolver
+from SudokuTables import getTables
+from SudokuMetrics import report, timedSearch
+
+
+# Techniques tried, in this order, once naked and hidden singles make no more progress
+TECHNIQUES = ('pointingPairs', 'boxLineReduction', 'nakedPairs', 'hiddenPairs',
+              'nakedTriples', 'hiddenTriples', 'xWing')
 
 
 class SudokuConstraintSolver:
     
+    # One candidate bitmask per cell, in row-major order (see SudokuTables)
     potentialSolutions = None
 
+    # Counters kept up to date as cells change, so that the checks
+    # below do not need to scan the grid
+    potentialAnswersCount = 0
+    solvedCellsCount = 0
+    emptyCellsCount = 0
+
+    # Number of potential answers removed, and search nodes and backtracks used, by the last solve
+    propagations = 0
+    nodes = 0
+    backtracks = 0
+
+    # Number of times each technique removed potential answers in the last solve, by name
+    techniqueUses = None
+
+    # boxSize sets the size of the board, 3 for 9x9 boards, 4 for 16x16, 5 for 25x25
+    # techniques chooses which of TECHNIQUES to use, () for singles only
+    # sink is given a record of the propagation and search phases of each solve (see SudokuMetrics)
+    def __init__(self, boxSize=3, techniques=TECHNIQUES, sink=None):
+        self.box = boxSize
+        self.size = boxSize * boxSize
+        self.tables = getTables(boxSize)
+        self.sink = sink
+
+        for name in techniques:
+            if name not in TECHNIQUES:
+                raise ValueError("Unknown technique: %s" % name)
+        self.techniques = techniques
+
     # puzzle should be a 9x9 array, with 0 representing empty cells,
     # and 1-9 representing fixed values in the puzzle.
+    # (or 16x16 with 1-16, and so on, for larger box sizes)
     def solve(self, puzzle):
+        # limit to at most 10 solutions
+        return list(islice(self.iter_solutions(puzzle), 10))
+
+
+    # Yields each solution as soon as it is found.
+    # Solutions are only kept by the caller, and any search stops when the caller stops iterating.
+    def iter_solutions(self, puzzle):
+        start = time.time()
         self.initializeAllPotentialSolutions()
+        self.propagations = 0
+        self.nodes = 0
+        self.backtracks = 0
+        self.techniqueUses = {}
 
         # Set answers for fixed values in puzzle
-        self.setAnswersForFixedValues()
+        self.setAnswersForFixedValues(puzzle)
 
         potentialAnswersCount = self.countPotentialAnswers()
         while True:
             # run unique contraint check on each cell
-            for y in range(0,9):
-                for x in range(0,9):
+            for y in range(0,self.size):
+                for x in range(0,self.size):
                     self.checkUniqueConstraint(x, y)
+            self.propagations = self.tables.CELLS * self.size - self.countPotentialAnswers()
 
             # stop when unique solution is found
             if self.uniqueSolutionFound():
                 #print "Unique solution found"
-                solution = np.array(self.potentialSolutions).reshape((9,9))
+                solution = np.array([self.tables.BIT_DIGIT[m] for m in self.potentialSolutions]).reshape((self.size,self.size))
                 #print "Verification result:", self.verify(solution)
                 #print solution
-                return [solution]
+                self.reportPropagation(start)
+                yield solution
+                return
             # stop if any cell has no potential answers
             elif self.noSolutionFound():
                 #print "No solution found"
-                self.printPotentialSolutions()
-                return []
-            # stop if no change to potential solutions
-            elif potentialAnswersCount == self.countPotentialAnswers():
+                #self.printPotentialSolutions()
+                self.reportPropagation(start)
+                return
+            # stop if no change to potential solutions, and no other technique helps
+            elif potentialAnswersCount == self.countPotentialAnswers() and not self.applyTechniques():
                 # cannot determmine solution/multiple solutions
-                # use backtracking algorithm
-                # limit to at most 10 solutions
-                return SudokuBacktrackingSolver().solve(puzzle, 10)
+                # use dancing links search, starting from the remaining potential answers
+                self.reportPropagation(start)
+                search = SudokuDLXSolver(self.box)
+                solutions = search.iter_solutions(puzzle, self.potentialSolutions)
+                if self.sink is not None:
+                    solutions = timedSearch(self.sink, 'constraint.search', solutions,
+                                            lambda: {'nodes': search.nodes, 'backtracks': search.backtracks})
+                for solution in solutions:
+                    self.nodes = search.nodes
+                    self.backtracks = search.backtracks
+                    yield solution
+                self.nodes = search.nodes
+                self.backtracks = search.backtracks
+                return
 
 
             potentialAnswersCount = self.countPotentialAnswers()
 
-        #self.printPotentialSolutions()
-        
-        return self.potentialSolutions
 
+    # Reports the propagation phase, from start until now, to the sink
+    def reportPropagation(self, start):
+        report(self.sink, 'constraint.propagation', time.time() - start,
+               propagations=self.propagations, solvedCells=self.solvedCellsCount)
 
-    def setAnswersForFixedValues(self):
-        for y in range(0,9):
-            for x in range(0,9):
+
+    def setAnswersForFixedValues(self, puzzle):
+        for y in range(0,self.size):
+            for x in range(0,self.size):
                 if puzzle[y][x] != 0:
                     ans = puzzle[y][x]
                     self.setAnswer(x, y, ans)
@@ -62,22 +128,25 @@ class SudokuConstraintSolver:
 
     def printPotentialSolutions(self):
         # print potential solutions
+        size = self.size
         print "Potential solutions:"
-        for y in range(0,9):
-            print self.potentialSolutions[y]
+        for y in range(0,size):
+            print [list(self.tables.maskDigits(m)) for m in self.potentialSolutions[y*size:y*size+size]]
 
         # print number of potential answers for each cell
         print "Number of potential answers:"
-        for y in range(0,9):
-            print map(len,self.potentialSolutions[y])
+        for y in range(0,size):
+            print [self.tables.BIT_COUNT[m] for m in self.potentialSolutions[y*size:y*size+size]]
 
 
     def verify(self, puzzle):
+        size = self.size
+        box = self.box
 
-        # Check all numbers are between 1-9 inclusive
-        for y in range(0,9):
-            for x in range(0,9):
-                if puzzle[y][x] > 9 or puzzle[y][x] < 1:
+        # Check all numbers are between 1-9 inclusive (1-size for larger boards)
+        for y in range(0,size):
+            for x in range(0,size):
+                if puzzle[y][x] > size or puzzle[y][x] < 1:
                     print "Invalid number at (%d, %d): %d" % (y, x, puzzle[y][x])
                     return False
 
@@ -93,7 +162,7 @@ class SudokuConstraintSolver:
             return -1
 
         # Check rows
-        for y in range(0,9):
+        for y in range(0,size):
             row = puzzle[y,:]
             invalidDigit = invalid(row)
             if invalidDigit >= 0:
@@ -101,7 +170,7 @@ class SudokuConstraintSolver:
                 return False
 
         # Check columns
-        for x in range(0,9):
+        for x in range(0,size):
             col = puzzle[:,x]
             invalidDigit = invalid(col)
             if invalidDigit >= 0:
@@ -109,134 +178,290 @@ class SudokuConstraintSolver:
                 return False
 
         # Check boxes
-        for y in range(0,9,3):
-            for x in range(0,9,3):
-                box = puzzle[y:y+3,x:x+3].flatten()
-                invalidDigit = invalid(box)
+        for y in range(0,size,box):
+            for x in range(0,size,box):
+                cells = puzzle[y:y+box,x:x+box].flatten()
+                invalidDigit = invalid(cells)
                 if invalidDigit >= 0:
-                    print "Invalid number %d in box (%d, %d)" % (box[invalidDigit], y/3, x/3)
+                    print "Invalid number %d in box (%d, %d)" % (cells[invalidDigit], y/box, x/box)
                     return False
 
         return True
 
 
     def checkUniqueConstraint(self, x, y):
+        cell = y*self.size + x
+        candidates = self.potentialSolutions[cell]
+
         # no need to check
-        if len(self.potentialSolutions[y][x]) == 1:
+        if self.tables.BIT_COUNT[candidates] <= 1:
             return
 
-        # For each potential answer in given cell
-        for i in range(0, len(self.potentialSolutions[y][x])):
-            num = self.potentialSolutions[y][x][i]
-
-            # check if potential answer is unique in row
-            unique = True
-            for _x in range(0, 9):
-                if _x != x and (num in self.potentialSolutions[y][_x]):
-                    unique = False
-                    break
-            
-            if unique == True:
-                self.setAnswer(x, y, num)
-                break
-
-            # check if potential answer is unique in col
-            unique = True
-            for _y in range(0, 9):
-                if _y != y and (num in self.potentialSolutions[_y][x]):
-                    unique = False
-                    break
-            
-            if unique == True:
-                self.setAnswer(x, y, num)
-                break
-
-            # check if potential answer is unique in box
-            unique = True
-            box_x = (x/3) * 3
-            box_y = (y/3) * 3
-            for _y in range(box_y,box_y+3):
-                for _x in range(box_x,box_x+3):
-                    if (_x != x or _y != y) and (num in self.potentialSolutions[_y][_x]):
-                        unique = False
-                        break
-                if unique == False:
-                    break
-            
-            if unique == True:
-                self.setAnswer(x, y, num)
-                break
+        # A potential answer is unique in a row, col or box if no other
+        # cell in that unit still has it
+        for unit in self.tables.CELL_UNITS[cell]:
+            others = 0
+            for c in unit:
+                if c != cell:
+                    others |= self.potentialSolutions[c]
+
+            unique = candidates & ~others
+            if unique:
+                # If more than one answer is unique, the cell has no
+                # solution; setting the lowest one lets propagation find that out
+                self.setAnswer(x, y, self.tables.BIT_DIGIT[unique & -unique])
+                return
 
 
     def setAnswer(self, x, y, answer):
-        self.potentialSolutions[y][x] = [answer]
-        # Remove answer from row
-        for _x in range(0,9):
-            if _x != x and (answer in self.potentialSolutions[y][_x]):
-                self.potentialSolutions[y][_x].remove(answer)
-                if len(self.potentialSolutions[y][_x]) == 1:
-                    self.setAnswer(_x, y, self.potentialSolutions[y][_x][0])
-
-        # Remove answer from col
-        for _y in range(0,9):
-            if _y != y and (answer in self.potentialSolutions[_y][x]):
-                self.potentialSolutions[_y][x].remove(answer)
-                if len(self.potentialSolutions[_y][x]) == 1:
-                    self.setAnswer(x, _y, self.potentialSolutions[_y][x][0])
-                
-        # remove answer from box
-        box_x = (x/3) * 3
-        box_y = (y/3) * 3
-        for _y in range(box_y,box_y+3):
-            for _x in range(box_x,box_x+3):
-                if (_y != y or _x != x) and (answer in self.potentialSolutions[_y][_x]):
-                    self.potentialSolutions[_y][_x].remove(answer)
-                    if len(self.potentialSolutions[_y][_x]) == 1:
-                        self.setAnswer(_x, _y, self.potentialSolutions[_y][_x][0])
+        ps = self.potentialSolutions
+        BIT_COUNT, PEERS = self.tables.BIT_COUNT, self.tables.PEERS
+        cell = y*self.size + x
+        bit = self.tables.BIT[answer]
+        self.updateCell(cell, bit)
+
+        # Cells reduced to a single answer are queued, and their answer is
+        # removed from their own peers in turn
+        pending = [(cell, bit)]
+        removed = 0
+        solved = 0
+        emptied = 0
+        while pending:
+            cell, bit = pending.pop()
+            # Skip cells that lost their last answer since being queued
+            if ps[cell] != bit:
+                continue
+
+            # Remove answer from row, col and box
+            for peer in PEERS[cell]:
+                candidates = ps[peer]
+                if candidates & bit:
+                    candidates &= ~bit
+                    ps[peer] = candidates
+                    removed += 1
+                    count = BIT_COUNT[candidates]
+                    if count == 1:
+                        solved += 1
+                        pending.append((peer, candidates))
+                    elif count == 0:
+                        solved -= 1
+                        emptied += 1
+
+        # Counters are updated once, rather than for every removal
+        self.potentialAnswersCount -= removed
+        self.solvedCellsCount += solved
+        self.emptyCellsCount += emptied
+
+
+    # Removes the answers in mask from a cell, setting the answer if only one is left.
+    # Returns True if anything was removed.
+    def removeCandidates(self, cell, mask):
+        candidates = self.potentialSolutions[cell]
+        if candidates & mask == 0:
+            return False
+
+        candidates &= ~mask
+        self.updateCell(cell, candidates)
+        if self.tables.BIT_COUNT[candidates] == 1:
+            self.setAnswer(cell % self.size, cell // self.size, self.tables.BIT_DIGIT[candidates])
+        return True
+
+
+    # Tries each enabled technique in turn, stopping at the first that removes
+    # any potential answers. Returns True if one did.
+    def applyTechniques(self):
+        for name in self.techniques:
+            if name == 'pointingPairs':
+                progress = self.removePointingPairs()
+            elif name == 'boxLineReduction':
+                progress = self.removeBoxLineReductions()
+            elif name == 'nakedPairs':
+                progress = self.removeNakedSubsets(2)
+            elif name == 'hiddenPairs':
+                progress = self.removeHiddenSubsets(2)
+            elif name == 'nakedTriples':
+                progress = self.removeNakedSubsets(3)
+            elif name == 'hiddenTriples':
+                progress = self.removeHiddenSubsets(3)
+            elif name == 'xWing':
+                progress = self.removeXWings()
+
+            if progress:
+                self.techniqueUses[name] = self.techniqueUses.get(name, 0) + 1
+                return True
+        return False
+
+
+    # Naked pairs/triples: if k cells of a unit only have k potential answers
+    # between them, those answers can be removed from the rest of the unit
+    def removeNakedSubsets(self, k):
+        ps = self.potentialSolutions
+        BIT_COUNT = self.tables.BIT_COUNT
+        progress = False
+
+        for unit in self.tables.UNITS:
+            cells = [c for c in unit if 2 <= BIT_COUNT[ps[c]] <= k]
+            for subset in combinations(cells, k):
+                union = 0
+                for c in subset:
+                    union |= ps[c]
+                if BIT_COUNT[union] != k:
+                    continue
+
+                for c in unit:
+                    if c not in subset:
+                        progress |= self.removeCandidates(c, union)
+
+        return progress
+
+
+    # Hidden pairs/triples: if k answers can only go in the same k cells of a unit,
+    # every other answer can be removed from those cells
+    def removeHiddenSubsets(self, k):
+        ps = self.potentialSolutions
+        BIT_COUNT, BIT, ALL = self.tables.BIT_COUNT, self.tables.BIT, self.tables.ALL
+        progress = False
+
+        for unit in self.tables.UNITS:
+            # For each answer, the cells it can go in, as bits indexed by position in the unit
+            places = [0] * (self.size + 1)
+            for i, c in enumerate(unit):
+                for n in range(1, self.size + 1):
+                    if ps[c] & BIT[n]:
+                        places[n] |= 1 << i
+
+            answers = [n for n in range(1, self.size + 1) if 2 <= BIT_COUNT[places[n]] <= k]
+            for subset in combinations(answers, k):
+                cellsUsed = 0
+                keep = 0
+                for n in subset:
+                    cellsUsed |= places[n]
+                    keep |= BIT[n]
+                if BIT_COUNT[cellsUsed] != k:
+                    continue
+
+                for i, c in enumerate(unit):
+                    if cellsUsed & (1 << i):
+                        progress |= self.removeCandidates(c, ALL & ~keep)
+
+        return progress
+
+
+    # Pointing pairs: if an answer can only go in one row (or col) within a box,
+    # it can be removed from the rest of that row (or col)
+    def removePointingPairs(self):
+        t = self.tables
+        progress = False
+
+        for b, box in enumerate(t.BOXES):
+            for n in range(1, self.size + 1):
+                bit = t.BIT[n]
+                cells = [c for c in box if self.potentialSolutions[c] & bit]
+                if len(cells) < 2:
+                    continue
+
+                for lineOf, lines in ((t.ROW_OF, t.ROWS), (t.COL_OF, t.COLS)):
+                    line = lineOf[cells[0]]
+                    if all(lineOf[c] == line for c in cells):
+                        for c in lines[line]:
+                            if t.BOX_OF[c] != b:
+                                progress |= self.removeCandidates(c, bit)
+
+        return progress
+
+
+    # Box-line reduction: if an answer can only go in one box within a row (or col),
+    # it can be removed from the rest of that box
+    def removeBoxLineReductions(self):
+        t = self.tables
+        progress = False
+
+        for lineOf, lines in ((t.ROW_OF, t.ROWS), (t.COL_OF, t.COLS)):
+            for l, line in enumerate(lines):
+                for n in range(1, self.size + 1):
+                    bit = t.BIT[n]
+                    cells = [c for c in line if self.potentialSolutions[c] & bit]
+                    if len(cells) < 2:
+                        continue
+
+                    b = t.BOX_OF[cells[0]]
+                    if all(t.BOX_OF[c] == b for c in cells):
+                        for c in t.BOXES[b]:
+                            if lineOf[c] != l:
+                                progress |= self.removeCandidates(c, bit)
+
+        return progress
+
+
+    # X-wing: if an answer can only go in the same two cols of two rows, it can
+    # be removed from the rest of those two cols (and the same with rows and cols swapped)
+    def removeXWings(self):
+        t = self.tables
+        progress = False
+
+        for n in range(1, self.size + 1):
+            bit = t.BIT[n]
+            for lines, lineOf, crossLines, crossOf in ((t.ROWS, t.ROW_OF, t.COLS, t.COL_OF),
+                                                       (t.COLS, t.COL_OF, t.ROWS, t.ROW_OF)):
+                # Lines where the answer has exactly two places, keyed by those places
+                pairs = {}
+                for l, line in enumerate(lines):
+                    places = tuple(crossOf[c] for c in line if self.potentialSolutions[c] & bit)
+                    if len(places) == 2:
+                        pairs.setdefault(places, []).append(l)
+
+                for places, found in pairs.items():
+                    if len(found) != 2:
+                        continue
+                    for cross in places:
+                        for c in crossLines[cross]:
+                            if lineOf[c] not in found:
+                                progress |= self.removeCandidates(c, bit)
+
+        return progress
+
+
+    # Replaces the potential answers of a cell, keeping the counters in step
+    def updateCell(self, cell, candidates):
+        before = self.tables.BIT_COUNT[self.potentialSolutions[cell]]
+        after = self.tables.BIT_COUNT[candidates]
+        self.potentialSolutions[cell] = candidates
+
+        self.potentialAnswersCount += after - before
+        self.solvedCellsCount += (after == 1) - (before == 1)
+        self.emptyCellsCount += (after == 0) - (before == 0)
 
 
     # unique solution found if all cells has only 1 potential answer
     def uniqueSolutionFound(self):
-        for y in range(0,9):
-            for x in range(0,9):
-                if len(self.potentialSolutions[y][x]) != 1:
-                    return False
-        return True
+        return self.solvedCellsCount == self.tables.CELLS
 
 
     # no solution if any cell has 0 potential answers
     def noSolutionFound(self):
-        for y in range(0,9):
-            for x in range(0,9):
-                if len(self.potentialSolutions[y][x]) == 0:
-                    return True
-        return False
+        return self.emptyCellsCount > 0
 
 
     # count number of potential answers
     def countPotentialAnswers(self):
-        total = 0
-        for y in range(0,9):
-            for x in range(0,9):
-                total += len(self.potentialSolutions[y][x])
-
-        return total
+        return self.potentialAnswersCount
 
 
     def initializeAllPotentialSolutions(self):
-        self.potentialSolutions = []
-        for y in range(0,9):
-            self.potentialSolutions.append([])
-            for x in range(0,9):
-                self.potentialSolutions[y].append([])
-                for i in range(0,9):
-                    self.potentialSolutions[y][x].append(i+1)
+        self.potentialSolutions = [self.tables.ALL] * self.tables.CELLS
+        self.potentialAnswersCount = self.tables.CELLS * self.size
+        self.solvedCellsCount = 0
+        self.emptyCellsCount = 0
 
 
 #
 #   Main Entry Point
 #
 if __name__ == '__main__':
+    # Imported here so the solver itself does not need OpenCV
+    import cv2
+    from SudokuExtractor import SudokuExtractor
+
     extractor = SudokuExtractor()
     puzzle = extractor.extract("sudoku_original.jpg")
     solution = SudokuConstraintSolver().solve(puzzle)
@@ -0,0 +1,277 @@
+import Puzzles
+from SudokuMetrics import timedSearch
+
+# Summary
+# -------
+# Solves a sudoku puzzle as an exact cover problem, using Knuth's
+# Algorithm X with Dancing Links.
+#
+# Each of the 729 rows of the matrix places one digit in one cell, and
+# covers 4 of the 324 columns (for a 9x9 board):
+#   - the cell is filled
+#   - the row contains the digit
+#   - the column contains the digit
+#   - the box contains the digit
+# A solution is a set of rows covering every column exactly once.
+#
+# Useful Resources
+# ----------------
+# 1 - http://arxiv.org/abs/cs/0011047
+#
+
+# Copies a grid into new lists of rows. Rows of a numpy array slice into views,
+# so each row is copied with list() rather than row[:].
+def copyList(xs):
+    return [list(row) for row in xs]
+
+
+# Builds the full matrix for a board with the given box size, as linked
+# lists held in flat arrays.
+# Node 0 is the root, the next 4*size*size nodes are the column headers,
+# and each matrix row is 4 nodes linked left to right.
+def buildMatrix(box):
+    size = box * box
+    cells = size * size
+    columns = 4 * cells
+
+    L = list(range(-1, columns))
+    R = list(range(1, columns + 2))
+    L[0] = columns
+    R[columns] = 0
+    U = list(range(columns + 1))
+    D = list(range(columns + 1))
+    C = list(range(columns + 1))
+    S = [0] * (columns + 1)
+    nodeRow = [-1] * (columns + 1)
+    rowNode = []
+
+    for r in range(cells * size):
+        cell, digit = r // size, r % size
+        y, x = cell // size, cell % size
+        b = (y // box) * box + x // box
+        rowColumns = [1 + cell,
+                      1 + cells + y * size + digit,
+                      1 + 2 * cells + x * size + digit,
+                      1 + 3 * cells + b * size + digit]
+
+        first = len(C)
+        rowNode.append(first)
+        for i, col in enumerate(rowColumns):
+            node = first + i
+            # Insert at the bottom of the column
+            U.append(U[col])
+            D.append(col)
+            D[U[col]] = node
+            U[col] = node
+            C.append(col)
+            S[col] += 1
+            nodeRow.append(r)
+            # Link into the row
+            L.append(first + (i - 1) % 4)
+            R.append(first + (i + 1) % 4)
+
+    return L, R, U, D, C, S, nodeRow, rowNode
+
+
+# Matrices are built once per box size, and copied for each puzzle.
+# C, nodeRow and rowNode never change during search so they are shared.
+matrixByBox = {}
+
+def getMatrix(box):
+    if box not in matrixByBox:
+        matrixByBox[box] = buildMatrix(box)
+    return matrixByBox[box]
+
+
+class SudokuDLXSolver:
+
+    # Number of rows chosen by the last search, and of columns it ran out of rows for
+    nodes = 0
+    backtracks = 0
+
+    # boxSize sets the size of the board, 3 for 9x9 boards, 4 for 16x16, 5 for 25x25
+    # sink is given a record of each search (see SudokuMetrics)
+    def __init__(self, boxSize=3, sink=None):
+        self.box = boxSize
+        self.size = boxSize * boxSize
+        self.sink = sink
+
+    # puzzle should be a 9x9 array, with 0 representing empty cells,
+    # and 1-9 representing fixed values in the puzzle.
+    # (or 16x16 with 1-16, and so on, for larger box sizes)
+    # Solves a puzzle represented as a 2D array.
+
+    # The limit parameter controls how many solutions to find
+    # (-1 being as many as possible)
+
+    # candidates optionally limits the values tried in each cell, as one bitmask
+    # per cell in row-major order (as kept by SudokuConstraintSolver), so search
+    # can start from answers already ruled out by propagation.
+
+    def solve(self, puzzle, limit=-1, candidates=None):
+
+        solutions = []
+
+        for solution in self.iter_solutions(puzzle, candidates):
+            solutions.append(solution)
+
+            if limit != -1 and len(solutions) >= limit:
+                break
+
+        return solutions
+
+
+    # Yields each solution as soon as it is found.
+    # Solutions are only kept by the caller, and the search stops when the caller stops iterating.
+    def iter_solutions(self, puzzle, candidates=None):
+        solutions = self.search(puzzle, candidates)
+        if self.sink is None:
+            return solutions
+        return timedSearch(self.sink, 'dlx.search', solutions,
+                           lambda: {'nodes': self.nodes, 'backtracks': self.backtracks})
+
+
+    # The search behind iter_solutions, without the timing
+    def search(self, puzzle, candidates=None):
+
+        size = self.size
+        cells = size * size
+        self.nodes = 0
+        self.backtracks = 0
+
+        L0, R0, U0, D0, C, S0, nodeRow, rowNode = getMatrix(self.box)
+        L, R, U, D, S = L0[:], R0[:], U0[:], D0[:], S0[:]
+
+        def cover(c):
+            L[R[c]] = L[c]
+            R[L[c]] = R[c]
+            i = D[c]
+            while i != c:
+                j = R[i]
+                while j != i:
+                    U[D[j]] = U[j]
+                    D[U[j]] = D[j]
+                    S[C[j]] -= 1
+                    j = R[j]
+                i = D[i]
+
+        def uncover(c):
+            i = U[c]
+            while i != c:
+                j = L[i]
+                while j != i:
+                    S[C[j]] += 1
+                    U[D[j]] = j
+                    D[U[j]] = j
+                    j = L[j]
+                i = U[i]
+            L[R[c]] = c
+            R[L[c]] = c
+
+        # Remove the rows of values ruled out for their cell, before any column is covered
+        if candidates is not None:
+            for cell in range(0, cells):
+                for digit in range(0, size):
+                    if not candidates[cell] & (1 << digit):
+                        first = rowNode[cell * size + digit]
+                        for j in range(first, first + 4):
+                            U[D[j]] = U[j]
+                            D[U[j]] = D[j]
+                            S[C[j]] -= 1
+
+        # Select the rows of the fixed values.
+        # A column that is already covered means two fixed values conflict.
+        for y in range(0, size):
+            for x in range(0, size):
+                if puzzle[y][x] != 0:
+                    if candidates is not None and not candidates[y * size + x] & (1 << (puzzle[y][x] - 1)):
+                        return
+                    first = rowNode[(y * size + x) * size + puzzle[y][x] - 1]
+                    for j in range(first, first + 4):
+                        if R[L[C[j]]] != C[j]:
+                            return
+                    for j in range(first, first + 4):
+                        cover(C[j])
+
+        # Iterative search, so the depth is not bound by the recursion limit.
+        # chosen[k] is the row node selected at depth k.
+        chosen = [0] * cells
+        k = 0
+        nodes = 0
+        backtracks = 0
+        forward = True
+        while True:
+            if forward:
+                if R[0] == 0:
+                    # Every column is covered, so the chosen rows are a solution
+                    solution = copyList(puzzle)
+                    for i in range(k):
+                        r = nodeRow[chosen[i]]
+                        solution[r // size // size][r // size % size] = r % size + 1
+                    self.nodes = nodes
+                    self.backtracks = backtracks
+                    yield solution
+                    forward = False
+                    continue
+
+                # Branch on the column with the fewest rows left
+                c = R[0]
+                best = c
+                fewest = S[c]
+                while c != 0 and fewest > 1:
+                    if S[c] < fewest:
+                        best = c
+                        fewest = S[c]
+                    c = R[c]
+
+                cover(best)
+                r = D[best]
+            else:
+                if k == 0:
+                    break
+                # Undo the row chosen at the previous depth, and move on to the next row in its column
+                k -= 1
+                r = chosen[k]
+                j = L[r]
+                while j != r:
+                    uncover(C[j])
+                    j = L[j]
+                r = D[r]
+
+            if r == C[r]:
+                # Column exhausted, backtrack
+                uncover(r)
+                backtracks += 1
+                forward = False
+                continue
+
+            chosen[k] = r
+            k += 1
+            nodes += 1
+            j = R[r]
+            while j != r:
+                cover(C[j])
+                j = R[j]
+            forward = True
+
+        self.nodes = nodes
+        self.backtracks = backtracks
+
+
+
+#
+#   Main Entry Point
+#
+if __name__ == '__main__':
+    puzzle = Puzzles.manySolutions
+    solutions = SudokuDLXSolver().solve(puzzle)
+    for solution in solutions:
+        Puzzles.prettyPrint(solution)
+
+    # Numpy puzzles must be left as they were, with each solution a separate grid
+    import numpy as np
+    grid = np.array(puzzle)
+    numpySolutions = SudokuDLXSolver().solve(grid)
+    assert (grid == np.array(puzzle)).all()
+    assert [np.array(s).tolist() for s in numpySolutions] == [np.array(s).tolist() for s in solutions]
+    print "Numpy input:", len(numpySolutions), "distinct solutions, puzzle unchanged"
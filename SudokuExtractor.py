@@ -1,6 +1,11 @@
+import os
+import time
+import threading
 import numpy as np
 import cv2
 from OCR_1 import OCR
+from OCRModels import getOCR
+from SudokuMetrics import report
 
 # Summary
 # -------
@@ -12,56 +17,321 @@ from OCR_1 import OCR
 # 2 - http://www.aishack.in/tutorials/sudoku-grabber-with-opencv-plot/
 # Main modifications are in the pre processing of images, and how digits are extracted.
 #
+# Usage
+# -----
+# SudokuExtractor().extract("sudoku_original.jpg") shows each stage in a window,
+# and returns the recognized puzzle.
+#
+# SudokuExtractor(headless=True).extractResult(image) never opens a window, for use
+# on servers without a display. image can be a filename, an encoded image buffer,
+# or an image array. It returns an ExtractionResult.
+#
+# SudokuExtractor(headless=True).extractStream("video.avi") yields an ExtractionResult per
+# frame of a video (or of any sequence of images), tracking the grid from frame to frame.
+#
+# SudokuExtractor(cell_digits=True) looks for digits cell by cell, skipping blank cells,
+# instead of searching the whole grid for digit contours.
+#
+# SudokuExtractor(pyramid_size=600) finds the grid in images of 1200 pixels or more on a
+# copy halved down to no less than 600 pixels, and then only works on the grid's region at full size.
+#
+# Threads
+# -------
+# Everything an extraction works on is kept in an ExtractionContext, not in the extractor,
+# so one headless extractor can be shared by many threads. Each thread gets its own context,
+# kept between calls so its buffers are reused, or a context can be passed in with ctx=.
+# Each stream has a context of its own.
+#
+# The grid is the largest of the outlines in the image with 4 corners. Others are kept as
+# candidates, ranked by size with a quality score, and extractCandidate(1) tries the next
+# one without searching the image again, for when the first gives no puzzle.
+#
+# SudokuExtractor(sink=metrics) reports the time and counters of each stage to a sink
+# (see SudokuMetrics), to find out which stage is slow on an image.
+#
 
-class SudokuExtractor:
-    original_color = None
-    original_gray = None
-    original_blur_gray = None
-    uniform_gray = None
-    uniform_blur_gray = None
-    threshold_original_blur_gray = None
-    threshold_uniform_blur_gray = None
-
-    contour_actual = None
-    contour_approx = None
-
-    puzzle_actual_mask = None
-
-    warped_masked_original_color = None
-    warped_masked_uniform_gray = None
-    warped_masked_uniform_binary = None
-
-    digit_binary = None
-    digit_contours = []
+class ExtractionResult:
+    # found is False if no grid was found in the image, in which case the other fields are None.
+    # puzzle is the recognized 9x9 list, with 0 for empty cells.
+    # corners are the grid's corners in the image, clockwise from the top left.
+    # homography maps image coordinates to the 450x450 warped grid.
+    # confidences is a 9x9 array of how sure the OCR was of each digit, 0 for empty cells.
+    # overlay is the warped grid with the recognized digits drawn on, if it was asked for.
+    # tracked is True if the grid was followed from the previous frame of a stream, instead of searched for.
+    # quality is the GridCandidate quality of the grid, None if it was tracked.
+    # candidates is the number of grid candidates found, which extractCandidate can go through.
+    def __init__(self, puzzle=None, corners=None, homography=None, confidences=None, overlay=None, tracked=False,
+                 quality=None, candidates=0):
+        self.found = puzzle is not None
+        self.puzzle = puzzle
+        self.corners = corners
+        self.homography = homography
+        self.confidences = confidences
+        self.overlay = overlay
+        self.tracked = tracked
+        self.quality = quality
+        self.candidates = candidates
+
+
+# An outline in the image that may be the grid.
+# contour_actual is the outline, and contour_approx its 4 corners.
+# area is the outline's area. quality is how much it looks like a grid, from 0 to 1:
+# how fully the outline fills the quadrilateral of its corners, times how close to square that is.
+class GridCandidate:
+    def __init__(self, contour_actual, contour_approx, area, quality):
+        self.contour_actual = contour_actual
+        self.contour_approx = contour_approx
+        self.area = area
+        self.quality = quality
+
+    # The same candidate in an image scale times larger
+    def scaled(self, scale):
+        return GridCandidate(self.contour_actual * scale, self.contour_approx * scale, self.area * scale * scale, self.quality)
+
+
+# The state of one extraction at a time: the image at each stage, the grid found in it,
+# and the recognized digits. Images are written into buffers that are kept from call to
+# call, so a context reused for images of one size allocates almost nothing.
+# A context must only be used by one thread at a time.
+class ExtractionContext:
+    def __init__(self):
+        self.original_color = None
+        self.original_gray = None
+        self.original_blur_gray = None
+        self.uniform_gray = None
+        self.uniform_blur_gray = None
+        self.threshold_original_blur_gray = None
+        self.threshold_uniform_blur_gray = None
+
+        self.contour_actual = None
+        self.contour_approx = None
+
+        # GridCandidates, largest first, and the one in contour_actual and contour_approx
+        self.grid_candidates = []
+        self.grid_candidate = None
+
+        self.puzzle_actual_mask = None
+
+        self.warped_masked_original_color = None
+        self.warped_masked_uniform_gray = None
+        self.warped_masked_uniform_binary = None
+
+        self.digit_binary = None
+        self.digit_contours = []
+
+        # Each digit cropped to its bounding rectangle, and the (x, y) cell it is in
+        self.digit_images = []
+        self.digit_cells = []
+
+        self.corners = None
+        self.homography = None
+
+        self.recognized_puzzle = np.zeros((9,9), np.uint8)
+        self.recognized_confidence = np.zeros((9,9), np.float32)
+
+        # Stream state: the frame the grid was found in, with points and contours in it to track
+        # the grid from, and thumbnails of each cell as it was when last recognized
+        self.tracked_gray = None
+        self.tracked_points = None
+        self.tracked_contour_actual = None
+        self.tracked_contour_approx = None
+        self.cell_signatures = None
+
+        self.buffers = {}
+
+
+    # Returns the buffer kept under name, only allocating a new one when the shape asked for changes.
+    # Its content is whatever was last written to it.
+    def buffer(self, name, shape, dtype=np.uint8):
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype)
+            self.buffers[name] = buf
+        return buf
 
-    recognized_puzzle = np.zeros(((9,9)), np.uint8)
 
+class SudokuExtractor:
     ocr = None
 
-    def extract(self, image_filename="sudoku_original.jpg"):
-        self.getPuzzle(image_filename)
-        self.preprocessImages()
-        self.findPuzzle()
-        self.simpleWarp()
-        self.extractDigits()
-        self.recognizeDigits()
-        return self.recognized_puzzle.tolist()
-
-
-    def getPuzzle(self, image_filename):
-        self.original_color = cv2.imread(image_filename)
-        cv2.imshow("Original image color", self.original_color)
-
-
-    def preprocessImages(self):
-        self.original_gray = cv2.cvtColor(self.original_color, cv2.COLOR_BGR2GRAY)
-        self.uniform_gray = self.normalizeBrightness(self.original_gray)
-
-        self.original_blur_gray = cv2.GaussianBlur(self.original_gray, (5,5), 0)
-        self.uniform_blur_gray = cv2.GaussianBlur(self.uniform_gray, (5,5), 0)
-
-        self.threshold_original_blur_gray = cv2.adaptiveThreshold(self.original_blur_gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,5,2)
-        self.threshold_uniform_blur_gray = cv2.adaptiveThreshold(self.uniform_blur_gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,5,2)
+    # The grid is held still while it moves less than this many pixels between frames
+    stream_stable_pixels = 0.5
+    # A cell is recognized again once its thumbnail differs by this much on average (0-255)
+    stream_changed_threshold = 12
+
+    # Pixels at the edges of a cell that are left out of the ink test, as the grid lines run there
+    cell_margin = 8
+    # Fraction of the rest of the cell that must be ink for it to be looked at for a digit
+    cell_ink_density = 0.03
+
+    # Number of the largest outlines that are tried as the grid
+    candidate_contours = 5
+
+    # headless skips every window, so no display is needed.
+    # Images at least twice pyramid_size on their longest side are searched for the grid at a lower resolution first.
+    # cell_digits looks for digits in each cell with ink, instead of over the whole grid.
+    # sink is given a record of each stage as it finishes (see SudokuMetrics).
+    def __init__(self, headless=False, pyramid_size=None, cell_digits=False, sink=None):
+        self.headless = headless
+        self.pyramid_size = pyramid_size
+        self.cell_digits = cell_digits
+        self.sink = sink
+        self.contexts = threading.local()
+
+
+    # The calling thread's context, created on its first extraction
+    def getContext(self):
+        ctx = getattr(self.contexts, 'ctx', None)
+        if ctx is None:
+            ctx = ExtractionContext()
+            self.contexts.ctx = ctx
+        return ctx
+
+
+    # ctx is the ExtractionContext to work in, the calling thread's own by default
+    def extract(self, image_filename="sudoku_original.jpg", ctx=None):
+        ctx = ctx or self.getContext()
+        self.getPuzzle(ctx, image_filename)
+        self.locatePuzzle(ctx)
+        self.simpleWarp(ctx)
+        self.extractDigits(ctx)
+        self.recognizeDigits(ctx)
+        return ctx.recognized_puzzle.tolist()
+
+
+    # Runs every stage, and returns an ExtractionResult instead of only the puzzle.
+    # The overlay is only drawn when asked for.
+    # The result holds copies, so it stays valid when the context is used again.
+    def extractResult(self, image, overlay=False, ctx=None):
+        ctx = ctx or self.getContext()
+        self.getPuzzle(ctx, image)
+        self.locatePuzzle(ctx)
+        return self.recognizeResult(ctx, overlay)
+
+
+    # Extracts the puzzle again from another grid candidate of the last extraction in the context,
+    # without searching the image again. Candidate 0 is the one extracted first.
+    def extractCandidate(self, index, overlay=False, ctx=None):
+        ctx = ctx or self.getContext()
+        self.selectCandidate(ctx, index)
+        return self.recognizeResult(ctx, overlay)
+
+
+    # Recognizes the digits in the grid found, and returns them as an ExtractionResult
+    def recognizeResult(self, ctx, overlay):
+        if ctx.contour_approx is None:
+            return ExtractionResult(candidates=len(ctx.grid_candidates))
+        self.simpleWarp(ctx)
+        self.extractDigits(ctx)
+        self.recognizeDigits(ctx)
+
+        overlay_image = None
+        if overlay:
+            overlay_image = self.drawOverlayPuzzle(ctx=ctx)
+
+        return ExtractionResult(ctx.recognized_puzzle.tolist(), ctx.corners.copy(), ctx.homography.copy(),
+                                ctx.recognized_confidence.copy(), overlay_image, False,
+                                ctx.grid_candidate.quality, len(ctx.grid_candidates))
+
+
+    # Extracts the puzzle from each frame of a video, yielding an ExtractionResult per frame.
+    # frames can be a video filename, a camera index, or any iterable of images.
+    # Once found, the grid is tracked from frame to frame with optical flow instead of being
+    # searched for again, and only cells whose content changed are recognized again.
+    def extractStream(self, frames, overlay=False):
+        if isinstance(frames, (basestring, int)):
+            frames = self.readFrames(frames)
+
+        # Tracking state belongs to this stream alone
+        ctx = ExtractionContext()
+        for frame in frames:
+            self.getPuzzle(ctx, frame)
+
+            tracked = ctx.tracked_gray is not None and self.trackPuzzle(ctx)
+            if not tracked:
+                self.locatePuzzle(ctx)
+                ctx.cell_signatures = None
+                if ctx.contour_approx is None:
+                    ctx.tracked_gray = None
+                    yield ExtractionResult()
+                    continue
+                self.startTracking(ctx)
+
+            self.simpleWarp(ctx)
+            self.recognizeChangedDigits(ctx)
+
+            overlay_image = None
+            if overlay:
+                overlay_image = self.drawOverlayPuzzle(ctx=ctx)
+
+            quality = None if tracked else ctx.grid_candidate.quality
+            yield ExtractionResult(ctx.recognized_puzzle.tolist(), ctx.corners.copy(), ctx.homography.copy(),
+                                   ctx.recognized_confidence.copy(), overlay_image, tracked,
+                                   quality, len(ctx.grid_candidates))
+
+
+    # Yields the frames of a video file or camera
+    def readFrames(self, video):
+        capture = cv2.VideoCapture(video)
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield frame
+        finally:
+            capture.release()
+
+
+    # image can be a filename, an encoded image buffer (bytearray, buffer or memoryview),
+    # or an image array (grayscale or BGR)
+    def getPuzzle(self, ctx, image):
+        start = time.time()
+        ctx.original_color = self.readImage(image)
+        report(self.sink, 'getPuzzle', time.time() - start, pixels=ctx.original_color.shape[0] * ctx.original_color.shape[1])
+        if not self.headless:
+            cv2.imshow("Original image color", ctx.original_color)
+
+
+    def readImage(self, image):
+        if isinstance(image, np.ndarray):
+            if image.ndim == 2:
+                return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            return image
+
+        # Filenames never hold a NUL byte, while encoded images always do,
+        # so image data passed in as a str is still decoded
+        if isinstance(image, basestring) and '\0' not in image:
+            if not os.path.isfile(image):
+                raise IOError("No such image file: %s" % image)
+            color = cv2.imread(image)
+        else:
+            color = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+
+        if color is None:
+            raise ValueError("Could not decode image")
+        return color
+
+
+    # Preprocesses the image and finds the grid in it
+    def locatePuzzle(self, ctx):
+        if self.pyramid_size is not None and max(ctx.original_color.shape[:2]) >= 2 * self.pyramid_size:
+            self.findPuzzlePyramid(ctx)
+        else:
+            self.preprocessImages(ctx)
+            self.findPuzzle(ctx)
+
+
+    def preprocessImages(self, ctx):
+        start = time.time()
+        ctx.original_gray = cv2.cvtColor(ctx.original_color, cv2.COLOR_BGR2GRAY)
+        ctx.uniform_gray = self.normalizeBrightness(ctx.original_gray)
+
+        ctx.original_blur_gray = cv2.GaussianBlur(ctx.original_gray, (5,5), 0)
+        ctx.uniform_blur_gray = cv2.GaussianBlur(ctx.uniform_gray, (5,5), 0)
+
+        ctx.threshold_original_blur_gray = cv2.adaptiveThreshold(ctx.original_blur_gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,5,2)
+        ctx.threshold_uniform_blur_gray = cv2.adaptiveThreshold(ctx.uniform_blur_gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,5,2)
+        report(self.sink, 'preprocessImages', time.time() - start)
 
 
     def normalizeBrightness(self, img_gray):
@@ -72,61 +342,231 @@ class SudokuExtractor:
         return uniform_image
 
 
-    def findPuzzle(self):
-        # Finds largest contour
-        contours, hierarchy = cv2.findContours(self.threshold_original_blur_gray, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        biggest_actual = None
-        biggest_approx = None
-        max_area = 0
-        for i in contours:
-            # Find contour area
-            area = cv2.contourArea(i)
-            if area > 100:
-                # Get length of perimeter
-                peri = cv2.arcLength(i,True)
-                # Approximate countour with precision (0.02*peri)
-                approx = cv2.approxPolyDP(i,0.02*peri,True)
-                # Check for largest contour area, with 4 corners
-                if area > max_area and len(approx)==4:
-                    biggest_approx = approx
-                    biggest_actual = i
-                    max_area = area
-
-        # Set largest contours
-        self.contour_actual = biggest_actual
-        self.contour_approx = biggest_approx
+    def findPuzzle(self, ctx):
+        start = time.time()
+        ctx.grid_candidates, contours = self.findPuzzleCandidates(ctx.threshold_original_blur_gray)
+        self.selectCandidate(ctx, 0)
+        report(self.sink, 'findPuzzle', time.time() - start, contours=contours, candidates=len(ctx.grid_candidates),
+               found=int(ctx.contour_approx is not None))
+
+
+    # Finds the grid on a copy of the image halved for as long as it stays at least pyramid_size, then
+    # searches again at full resolution only around where it was found.
+    # Brightness is only normalized in that region, as nothing outside the grid is used.
+    def findPuzzlePyramid(self, ctx):
+        start = time.time()
+        ctx.original_gray = cv2.cvtColor(ctx.original_color, cv2.COLOR_BGR2GRAY)
+
+        small_gray = ctx.original_gray
+        scale = 1
+        while max(small_gray.shape) >= 2 * self.pyramid_size:
+            small_gray = cv2.pyrDown(small_gray)
+            scale *= 2
+
+        # pyrDown already smooths the image, so it is not blurred again
+        small_threshold = cv2.adaptiveThreshold(small_gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,5,2)
+        small_candidates, small_contours = self.findPuzzleCandidates(small_threshold)
+        # Search the whole image at full resolution if the grid is lost at low resolution.
+        # Those stages report themselves, and are counted in this stage's time too.
+        if not small_candidates:
+            self.preprocessImages(ctx)
+            self.findPuzzle(ctx)
+            report(self.sink, 'findPuzzlePyramid', time.time() - start, contours=small_contours,
+                   found=int(ctx.contour_approx is not None))
+            return
+
+        # Region around the grid at full resolution, with a margin for the downscaling error
+        [x,y,w,h] = cv2.boundingRect(small_candidates[0].contour_actual * scale)
+        margin = 4 * scale
+        (rows, cols) = ctx.original_gray.shape
+        x0, y0 = max(x - margin, 0), max(y - margin, 0)
+        x1, y1 = min(x + w + margin, cols), min(y + h + margin, rows)
+        roi_gray = ctx.original_gray[y0:y1, x0:x1]
+
+        roi_blur_gray = cv2.GaussianBlur(roi_gray, (5,5), 0)
+        roi_threshold = cv2.adaptiveThreshold(roi_blur_gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV,5,2)
+        ctx.grid_candidates, roi_contours = self.findPuzzleCandidates(roi_threshold, (x0, y0))
+
+        # Fall back to the candidates found at low resolution
+        if not ctx.grid_candidates:
+            ctx.grid_candidates = [candidate.scaled(scale) for candidate in small_candidates]
+
+        self.normalizeBrightnessRegion(ctx, x0, y0, x1, y1)
+        self.selectCandidate(ctx, 0)
+        report(self.sink, 'findPuzzlePyramid', time.time() - start, contours=small_contours + roi_contours,
+               candidates=len(ctx.grid_candidates), found=1)
+
+
+    # Sets uniform_gray to the normalized image inside a region, and black outside it
+    def normalizeBrightnessRegion(self, ctx, x0, y0, x1, y1):
+        ctx.uniform_gray = ctx.buffer('uniform_gray', ctx.original_gray.shape)
+        ctx.uniform_gray.fill(0)
+        ctx.uniform_gray[y0:y1, x0:x1] = self.normalizeBrightness(ctx.original_gray[y0:y1, x0:x1])
+
+
+    # Remembers the current frame, the grid's contours and points inside the grid, to track the grid from.
+    # Every later frame is tracked from this one, so tracking errors do not add up from frame to frame.
+    def startTracking(self, ctx):
+        ctx.tracked_gray = ctx.original_gray
+        ctx.tracked_contour_actual = np.float32(ctx.contour_actual)
+        ctx.tracked_contour_approx = np.float32(ctx.contour_approx)
+        ctx.tracked_points = cv2.goodFeaturesToTrack(ctx.original_gray, 100, 0.01, 10, mask=ctx.puzzle_actual_mask)
+        if ctx.tracked_points is None or len(ctx.tracked_points) < 8:
+            ctx.tracked_gray = None
+
+
+    # Follows the grid from the tracked frame to the current one with optical flow.
+    # Returns False if the grid was lost, and has to be searched for again.
+    def trackPuzzle(self, ctx):
+        start = time.time()
+        tracked = self.followPuzzle(ctx)
+        report(self.sink, 'trackPuzzle', time.time() - start, tracked=int(tracked))
+        return tracked
+
+
+    # trackPuzzle without the timing, as it can give up at several points
+    def followPuzzle(self, ctx):
+        gray = cv2.cvtColor(ctx.original_color, cv2.COLOR_BGR2GRAY)
+        points, status, _ = cv2.calcOpticalFlowPyrLK(ctx.tracked_gray, gray, ctx.tracked_points, None)
+        found = status.ravel() == 1
+        if np.count_nonzero(found) < 8:
+            return False
+
+        motion, inliers = cv2.findHomography(ctx.tracked_points[found], points[found], cv2.RANSAC, 3.0)
+        if motion is None or np.count_nonzero(inliers) < 8:
+            return False
+
+        approx = cv2.perspectiveTransform(ctx.tracked_contour_approx, motion)
+        if not cv2.isContourConvex(approx):
+            return False
+
+        ctx.original_gray = gray
+
+        # Hold the grid still through sub-pixel jitter, so the mask and homography are reused
+        if np.abs(approx - ctx.contour_approx).max() >= self.stream_stable_pixels:
+            ctx.contour_approx = approx
+            ctx.contour_actual = np.int32(np.round(cv2.perspectiveTransform(ctx.tracked_contour_actual, motion)))
+            self.setPuzzleMask(ctx)
+
+        # Only the region around the grid is normalized
+        [x,y,w,h] = cv2.boundingRect(ctx.contour_actual)
+        (rows, cols) = gray.shape
+        self.normalizeBrightnessRegion(ctx, max(x - 8, 0), max(y - 8, 0), min(x + w + 8, cols), min(y + h + 8, rows))
+        return True
+
+
+    # Returns the grid candidates in a threshold, largest first, and how many outlines were searched.
+    # offset is added to the points, for thresholds of a region of the image.
+    # Only outer outlines are listed, skipping the digits and noise inside the grid, and only the largest
+    # few are approximated by polygons. If none of them has 4 corners, the grid may be inside another
+    # outline (such as a page's), so every outline is listed instead.
+    def findPuzzleCandidates(self, threshold, offset=(0,0)):
+        contours, candidates = self.findCandidatesIn(threshold.copy(), cv2.RETR_EXTERNAL, offset)
+        if not candidates:
+            more, candidates = self.findCandidatesIn(threshold, cv2.RETR_LIST, offset)
+            contours += more
+        return candidates, contours
+
+
+    def findCandidatesIn(self, threshold, mode, offset):
+        contours, hierarchy = cv2.findContours(threshold, mode, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+        areas = [cv2.contourArea(i) for i in contours]
+        largest = sorted(range(len(contours)), key=areas.__getitem__, reverse=True)[:self.candidate_contours]
+
+        candidates = []
+        for index in largest:
+            area = areas[index]
+            if area <= 100:
+                break
+            i = contours[index]
+            # Get length of perimeter
+            peri = cv2.arcLength(i,True)
+            # Approximate countour with precision (0.02*peri)
+            approx = cv2.approxPolyDP(i,0.02*peri,True)
+            if len(approx)==4:
+                candidates.append(GridCandidate(i, approx, area, self.gridQuality(area, approx)))
+
+        return len(contours), candidates
+
+
+    # How much an outline with 4 corners looks like a grid, from 0 to 1 (see GridCandidate)
+    def gridQuality(self, area, approx):
+        corners = np.float32(approx.reshape(4,2))
+        corners_area = cv2.contourArea(corners)
+        if corners_area <= 0:
+            return 0.0
+        sides = np.sqrt(((corners - np.roll(corners, 1, axis=0)) ** 2).sum(axis=1))
+        return float(min(area / corners_area, 1.0) * sides.min() / sides.max())
+
+
+    # Makes the index-th grid candidate the grid, or none if there is no such candidate
+    def selectCandidate(self, ctx, index):
+        if index < len(ctx.grid_candidates):
+            ctx.grid_candidate = ctx.grid_candidates[index]
+            ctx.contour_actual = ctx.grid_candidate.contour_actual
+            ctx.contour_approx = ctx.grid_candidate.contour_approx
+        else:
+            ctx.grid_candidate = None
+            ctx.contour_actual = None
+            ctx.contour_approx = None
+        self.setPuzzleMask(ctx)
+
+
+    def setPuzzleMask(self, ctx):
+        # No grid found
+        if ctx.contour_approx is None:
+            ctx.puzzle_actual_mask = None
+            return
 
         # Get mask
-        self.puzzle_actual_mask = np.zeros((self.original_gray.shape),np.uint8)
-        cv2.drawContours(self.puzzle_actual_mask,[self.contour_actual],0,255,-1)
-        cv2.drawContours(self.puzzle_actual_mask,[self.contour_actual],0,0,2)
+        ctx.puzzle_actual_mask = ctx.buffer('puzzle_actual_mask', ctx.original_gray.shape)
+        ctx.puzzle_actual_mask.fill(0)
+        cv2.drawContours(ctx.puzzle_actual_mask,[ctx.contour_actual],0,255,-1)
+        cv2.drawContours(ctx.puzzle_actual_mask,[ctx.contour_actual],0,0,2)
 
 
-    def simpleWarp(self):
+    def simpleWarp(self, ctx):
+        start = time.time()
         # Get masked uniform image
-        masked_uniform_gray = cv2.bitwise_and(self.uniform_gray, self.puzzle_actual_mask)
+        masked_uniform_gray = cv2.bitwise_and(ctx.uniform_gray, ctx.puzzle_actual_mask,
+                                              dst=ctx.buffer('masked_uniform_gray', ctx.uniform_gray.shape))
 
         # rectify approx
-        rectify_contour_approx = self.rectify(self.contour_approx)
+        rectify_contour_approx = self.rectify(ctx.contour_approx)
         # warp to 450x450 image
         new_coordinates = np.array([ [0,0],[449,0],[449,449],[0,449] ],np.float32)
-        retval = cv2.getPerspectiveTransform(rectify_contour_approx, new_coordinates)
-        warped_masked_uniform_gray = cv2.warpPerspective(masked_uniform_gray, retval, (450,450))
-        warped_masked_original_color = cv2.warpPerspective(self.original_color, retval, (450,450))
-
-        _,warped_masked_uniform_binary = cv2.threshold(warped_masked_uniform_gray,0,255,cv2.THRESH_BINARY+cv2.THRESH_OTSU)
-
-        self.warped_masked_uniform_binary = warped_masked_uniform_binary
-        self.warped_masked_uniform_gray = warped_masked_uniform_gray
-        self.warped_masked_original_color = warped_masked_original_color
-
-
-    def extractDigits(self):
-        warped_masked_uniform_gray_inv = 255-self.warped_masked_uniform_binary
+        # Reuse the homography while the grid has not moved, as when tracking a steady video
+        if ctx.corners is None or not np.array_equal(rectify_contour_approx, ctx.corners):
+            ctx.corners = rectify_contour_approx
+            ctx.homography = cv2.getPerspectiveTransform(rectify_contour_approx, new_coordinates)
+        retval = ctx.homography
+        ctx.warped_masked_uniform_gray = cv2.warpPerspective(masked_uniform_gray, retval, (450,450),
+                                                             dst=ctx.buffer('warped_masked_uniform_gray', (450,450)))
+        ctx.warped_masked_original_color = cv2.warpPerspective(ctx.original_color, retval, (450,450),
+                                                               dst=ctx.buffer('warped_masked_original_color', (450,450,3)))
+
+        _,ctx.warped_masked_uniform_binary = cv2.threshold(ctx.warped_masked_uniform_gray,0,255,cv2.THRESH_BINARY+cv2.THRESH_OTSU,
+                                                           dst=ctx.buffer('warped_masked_uniform_binary', (450,450)))
+        report(self.sink, 'simpleWarp', time.time() - start)
+
+
+    def extractDigits(self, ctx):
+        start = time.time()
+        if self.cell_digits:
+            self.extractCellDigits(ctx)
+        else:
+            self.extractContourDigits(ctx)
+        report(self.sink, 'extractDigits', time.time() - start, digits=len(ctx.digit_images))
+
+
+    def extractContourDigits(self, ctx):
+        warped_masked_uniform_gray_inv = cv2.bitwise_not(ctx.warped_masked_uniform_binary,
+                                                         dst=ctx.buffer('warped_masked_uniform_gray_inv', (450,450)))
 
         # Flood fill from 4 corners
         h, w = warped_masked_uniform_gray_inv.shape[:2]
-        mask = np.zeros((h+2, w+2), np.uint8)
+        mask = ctx.buffer('flood_mask', (h+2, w+2))
+        mask.fill(0)
         cv2.floodFill(warped_masked_uniform_gray_inv, mask, (0,0), 0)
         cv2.floodFill(warped_masked_uniform_gray_inv, mask, (w-1,0), 0)
         cv2.floodFill(warped_masked_uniform_gray_inv, mask, (0,h-1), 0)
@@ -134,10 +574,9 @@ class SudokuExtractor:
 
         # get contours
         contours, hierarchy = cv2.findContours(warped_masked_uniform_gray_inv, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        digit_contours_overlay_color = self.warped_masked_original_color.copy()
-        digit_contours_mask_binary =  np.zeros((warped_masked_uniform_gray_inv.shape),np.uint8)
-        digit_binary = None
+
+        digit_contours_mask_binary = ctx.buffer('digit_contours_mask_binary', (h, w))
+        digit_contours_mask_binary.fill(0)
         digit_contours = []
 
         for i in contours:
@@ -146,33 +585,26 @@ class SudokuExtractor:
             # height and width of digit should be less than 50
             [_,_,w,h] = cv2.boundingRect(i)
             if area > 50 and w<50 and h<50:
-                cv2.drawContours(digit_contours_overlay_color, [i], 0, (0,255,0), 2)
-                cv2.drawContours(digit_contours_overlay_color, [i], 0, (0,255,0), -1)
-
                 cv2.drawContours(digit_contours_mask_binary, [i], 0, 255, 2)
                 cv2.drawContours(digit_contours_mask_binary, [i], 0, 255, -1)
 
                 digit_contours.append(i)
 
-        digit_binary = cv2.bitwise_and(digit_contours_mask_binary, warped_masked_uniform_gray_inv) * 255
+        digit_binary = cv2.bitwise_and(digit_contours_mask_binary, warped_masked_uniform_gray_inv,
+                                       dst=ctx.buffer('digit_binary', digit_contours_mask_binary.shape))
 
-        self.digit_binary = digit_binary
-        self.digit_contours = digit_contours
+        ctx.digit_binary = digit_binary
+        ctx.digit_contours = digit_contours
 
-
-    def recognizeDigits(self):
-        # Initialize OCR if it is not yet initialized
-        if self.ocr == None:
-            self.ocr = OCR()
-            self.ocr.loadData()
-
-        digit_binary = self.digit_binary.copy()
         # Pad borders so that digits close to edges can still be extracted
         padding = 50
-        digit_binary = cv2.copyMakeBorder(digit_binary,padding,padding,padding,padding,cv2.BORDER_CONSTANT,value=0)
+        (h, w) = digit_binary.shape
+        digit_binary = cv2.copyMakeBorder(digit_binary,padding,padding,padding,padding,cv2.BORDER_CONSTANT,value=0,
+                                          dst=ctx.buffer('digit_binary_padded', (h+2*padding, w+2*padding)))
 
-        # Process and recognize each digit
-        for i in self.digit_contours:
+        ctx.digit_images = []
+        ctx.digit_cells = []
+        for i in digit_contours:
             # Get centroid
             M = cv2.moments(i)
             cx = int(M['m10']/M['m00'])
@@ -192,42 +624,146 @@ class SudokuExtractor:
             if len(digit) == 0:
                 continue
 
-            # Set results
-            self.recognized_puzzle[cell[1]][cell[0]] = self.ocr.recognizeCharacter(digit)
+            ctx.digit_images.append(digit)
+            ctx.digit_cells.append(cell)
+
+
+    # Cuts the warped grid into its 81 cells, and only looks for a digit in cells with ink in them.
+    # Which cells have ink is tested for all cells at once, so blank cells cost no contour work.
+    def extractCellDigits(self, ctx):
+        ink = cv2.bitwise_not(ctx.warped_masked_uniform_binary, dst=ctx.buffer('warped_masked_uniform_gray_inv', (450,450)))
+        cells = ink.reshape(9,50,9,50).transpose(0,2,1,3)
+
+        m = self.cell_margin
+        density = np.count_nonzero(cells[:, :, m:-m, m:-m], axis=(2,3)) / float((50 - 2*m) ** 2)
+
+        ctx.digit_images = []
+        ctx.digit_cells = []
+        for y, x in np.argwhere(density > self.cell_ink_density):
+            digit = self.isolateDigit(cells[y, x])
+            if digit is not None:
+                ctx.digit_images.append(digit)
+                ctx.digit_cells.append((x, y))
+
+
+    # Returns the digit in a 50x50 cell of ink cropped to its bounding rectangle, or None if there is none.
+    # The digit is the largest shape centred away from the cell's edges, so grid lines are skipped.
+    # Every contour is listed, as a digit may sit inside the box the grid lines draw around the cell.
+    def isolateDigit(self, cell):
+        contours, hierarchy = cv2.findContours(cell.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        m = self.cell_margin
+        best = None
+        max_area = 50
+        for i in contours:
+            area = cv2.contourArea(i)
+            [x,y,w,h] = cv2.boundingRect(i)
+            cx = x + w/2
+            cy = y + h/2
+            if area > max_area and w < 45 and h < 45 and m <= cx < 50-m and m <= cy < 50-m:
+                best = i
+                max_area = area
+
+        if best is None:
+            return None
+
+        mask = np.zeros(cell.shape, np.uint8)
+        cv2.drawContours(mask, [best], 0, 255, -1)
+        [x,y,w,h] = cv2.boundingRect(best)
+        return cv2.bitwise_and(mask, cell)[y:y+h, x:x+w]
+
+
+    # Thumbnails of each cell of the warped grid, as a (9, 9, 10, 10) array
+    def cellSignatures(self, ctx):
+        small = cv2.resize(ctx.warped_masked_uniform_binary, (90,90), interpolation=cv2.INTER_AREA)
+        return np.float32(small).reshape(9,10,9,10).transpose(0,2,1,3)
+
+
+    # Recognizes only the cells that changed since they were last recognized
+    def recognizeChangedDigits(self, ctx):
+        signatures = self.cellSignatures(ctx)
+        if ctx.cell_signatures is None:
+            changed = np.ones((9,9), np.bool_)
+            ctx.cell_signatures = signatures
+        else:
+            changed = np.abs(signatures - ctx.cell_signatures).mean(axis=(2,3)) > self.stream_changed_threshold
+            ctx.cell_signatures[changed] = signatures[changed]
+
+        if changed.any():
+            self.extractDigits(ctx)
+            self.recognizeDigits(ctx, changed)
+
+
+    # changed optionally limits recognition to some cells, as a 9x9 bool array.
+    # The other cells keep what was recognized for them before.
+    def recognizeDigits(self, ctx, changed=None):
+        start = time.time()
+        # Use the process's shared OCR, loading it if no extractor has yet
+        if self.ocr is None:
+            self.ocr = getOCR(OCR)
+
+        if changed is None:
+            ctx.recognized_puzzle.fill(0)
+            ctx.recognized_confidence.fill(0)
+        else:
+            ctx.recognized_puzzle[changed] = 0
+            ctx.recognized_confidence[changed] = 0
+
+        # Recognize every digit at once
+        digits = []
+        cells = []
+        for digit, cell in zip(ctx.digit_images, ctx.digit_cells):
+            if changed is None or changed[cell[1]][cell[0]]:
+                digits.append(digit)
+                cells.append(cell)
+
+        # Set results
+        values, confidences = self.ocr.recognizeCharacters(digits)
+        for cell, value, confidence in zip(cells, values, confidences):
+            ctx.recognized_puzzle[cell[1]][cell[0]] = value
+            ctx.recognized_confidence[cell[1]][cell[0]] = confidence
+        report(self.sink, 'recognizeDigits', time.time() - start, digits=len(digits))
 
         # Draw text on image to verify
-        self.showOverlayPuzzle()
+        if not self.headless:
+            self.showOverlayPuzzle(ctx=ctx)
+
 
+    def showOverlayPuzzle(self, puzzle=None, window_name="Recognized puzzle", ctx=None):
+        cv2.imshow(window_name, self.drawOverlayPuzzle(puzzle, ctx))
 
-    def showOverlayPuzzle(self, puzzle=None, window_name="Recognized puzzle"):
-        if puzzle == None:
-            puzzle = self.recognized_puzzle
-        warped_masked_original_color = self.warped_masked_original_color.copy()
+
+    # Returns the warped grid with the digits of puzzle drawn on.
+    # Recognized digits are green, and the rest are blue.
+    def drawOverlayPuzzle(self, puzzle=None, ctx=None):
+        ctx = ctx or self.getContext()
+        if puzzle is None:
+            puzzle = ctx.recognized_puzzle
+        warped_masked_original_color = ctx.warped_masked_original_color.copy()
         for y in range(0,9):
             for x in range(0,9):
                 num = puzzle[y][x]
                 if num != 0:
-                    if self.recognized_puzzle[y][x] != 0:
+                    if ctx.recognized_puzzle[y][x] != 0:
                         cv2.putText(warped_masked_original_color,str(num), (x*50+25,y*50+35), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0))
                     else:
                         cv2.putText(warped_masked_original_color,str(num), (x*50+25,y*50+35), cv2.FONT_HERSHEY_SIMPLEX, 1, (255,0,0))
-        
-        cv2.imshow(window_name, warped_masked_original_color)
+
+        return warped_masked_original_color
 
 
     # Rectify - reshapes and sorts the order of points in a contour.
     def rectify(self, h):
         h = h.reshape((4,2))
         hnew = np.zeros((4,2),dtype = np.float32)
- 
+
         add = h.sum(1)
         hnew[0] = h[np.argmin(add)]
         hnew[2] = h[np.argmax(add)]
-         
+
         diff = np.diff(h,axis = 1)
         hnew[1] = h[np.argmin(diff)]
         hnew[3] = h[np.argmax(diff)]
-  
+
         return hnew
 
 
@@ -0,0 +1,354 @@
+import sys
+import random
+import hashlib
+import argparse
+import multiprocessing
+import Puzzles
+from itertools import islice
+from SudokuTables import getTables
+from SudokuBacktrackingSolver import SudokuBacktrackingSolver
+from SudokuConstraintSolver import SudokuConstraintSolver, TECHNIQUES
+from SudokuPool import runPool
+
+# Summary
+# -------
+# Generates new puzzles with a unique solution, graded by difficulty.
+#
+# Each puzzle is made in three steps:
+#   1. A full grid: the boxes on the diagonal are filled with random digits, as
+#      they share no rows or columns, and the rest is filled in by the MRV
+#      search. Rows, columns, bands and stacks are then shuffled at random.
+#   2. Clues are removed one at a time (or in symmetric pairs) in random order,
+#      keeping each removal only if the puzzle still has a unique solution.
+#      Every clue is tried once, so the puzzle is minimal: no clue left can be removed.
+#      Uniqueness is checked on candidate bitmasks kept up to date as clues are
+#      removed, by propagating singles and searching for a solution that differs
+#      from the grid at the removed cells.
+#   3. The puzzle is graded by what SudokuConstraintSolver needs to solve it:
+#        easy     naked and hidden singles alone
+#        medium   also the other techniques, but no search
+#        hard     search
+#        hardest  search with at least HARDEST_BACKTRACKS backtracks
+#
+# Puzzle i of a run is made from the seed and i alone, so a run gives the same
+# puzzles, in the same order, whatever the number of processes.
+#
+# Most of the time goes into the uniqueness searches of step 2, in pure Python,
+# so each process makes about 60 puzzles per second. Thousands per second need
+# a pool of dozens of cores.
+#
+# Usage
+# -----
+# python SudokuGenerator.py -n 10000 --seed 1 -o puzzles.txt
+# python SudokuGenerator.py -n 100 --grades hard hardest --symmetric
+#
+# Each output line is the puzzle (81 characters, 0 for empty cells), its grade,
+# number of clues, search nodes, and the techniques it needed, separated by tabs.
+# The first column can be passed straight to SudokuCLI.py.
+#
+
+GRADES = ['easy', 'medium', 'hard', 'hardest']
+
+# Backtracks of the constraint solver's search from which a puzzle is graded hardest
+HARDEST_BACKTRACKS = 100
+
+
+# A full valid grid, as a list of rows
+def randomGrid(rng, boxSize=3):
+    box = boxSize
+    size = box * box
+    digits = range(1, size+1)
+
+    while True:
+        grid = [[0] * size for _ in range(0, size)]
+        for b in range(0, box):
+            rng.shuffle(digits)
+            for i in range(0, size):
+                grid[b*box + i//box][b*box + i%box] = digits[i]
+
+        solutions = SudokuBacktrackingSolver(box).solveMRV(grid, 1)
+        if solutions:
+            break
+
+    # The search fills the other boxes with the lowest digits it can, so the grid is shuffled
+    rows = shuffledLines(rng, box)
+    cols = shuffledLines(rng, box)
+    grid = [[solutions[0][r][c] for c in cols] for r in rows]
+    if rng.random() < 0.5:
+        grid = [list(row) for row in zip(*grid)]
+    return grid
+
+
+# A random order of the lines of a board, moving lines only within their band
+# and whole bands, so the order keeps a valid grid valid
+def shuffledLines(rng, box):
+    bands = range(0, box)
+    rng.shuffle(bands)
+    lines = []
+    for band in bands:
+        offsets = range(0, box)
+        rng.shuffle(offsets)
+        lines += [band*box + offset for offset in offsets]
+    return lines
+
+
+# Removes clues from a full grid in random order, for as long as the puzzle keeps a
+# unique solution. With symmetric, cells are removed in pairs opposite the centre.
+# Returns a new puzzle, and leaves grid as it was.
+#
+# The candidates the clues leave each cell are kept as bitmasks (see SudokuTables),
+# updated as each clue is removed or put back, along with how many clues among each
+# cell's peers hold each digit. A removal keeps the solution unique if no solution
+# has a removed cell differ from the grid, which is searched for from those candidates.
+def removeClues(grid, rng, symmetric=False):
+    size = len(grid)
+    t = getTables(int(round(size ** 0.5)))
+    values = [grid[t.ROW_OF[c]][t.COL_OF[c]] for c in range(0, t.CELLS)]
+    filled = [True] * t.CELLS
+
+    # Every cell is a clue to start with, so each holds just its own digit
+    masks = [t.BIT[value] for value in values]
+    clueCounts = [[0] * (t.SIZE+1) for _ in range(0, t.CELLS)]
+    for cell in range(0, t.CELLS):
+        for peer in t.PEERS[cell]:
+            clueCounts[peer][values[cell]] += 1
+
+    cells = range(0, t.CELLS)
+    if symmetric:
+        cells = cells[:(t.CELLS+1)//2]
+    rng.shuffle(cells)
+
+    for cell in cells:
+        group = [cell]
+        if symmetric and t.CELLS-1-cell != cell:
+            group.append(t.CELLS-1-cell)
+
+        for c in group:
+            removeClue(c, values, filled, masks, clueCounts, t)
+
+        if hasOtherSolution(group, values, filled, masks, t):
+            for c in group:
+                restoreClue(c, values, filled, masks, clueCounts, t)
+
+    return [[values[y*size + x] if filled[y*size + x] else 0 for x in range(0, size)] for y in range(0, size)]
+
+
+# Empties a clue's cell, giving it and its peers back the digits no other clue rules out
+def removeClue(cell, values, filled, masks, clueCounts, t):
+    value = values[cell]
+    filled[cell] = False
+    used = 0
+    for digit in range(1, t.SIZE+1):
+        if clueCounts[cell][digit]:
+            used |= t.BIT[digit]
+    masks[cell] = t.ALL & ~used
+
+    bit = t.BIT[value]
+    for peer in t.PEERS[cell]:
+        clueCounts[peer][value] -= 1
+        if not filled[peer] and clueCounts[peer][value] == 0:
+            masks[peer] |= bit
+
+
+# Puts back a clue removed by removeClue
+def restoreClue(cell, values, filled, masks, clueCounts, t):
+    value = values[cell]
+    filled[cell] = True
+    masks[cell] = bit = t.BIT[value]
+    for peer in t.PEERS[cell]:
+        clueCounts[peer][value] += 1
+        if not filled[peer]:
+            masks[peer] &= ~bit
+
+
+# True if the puzzle has a solution where a cell of group differs from the grid's values.
+# Either the first cell differs, or it matches and one of the others differs.
+def hasOtherSolution(group, values, filled, masks, t):
+    # Another solution mostly agrees with the grid, so it is found soonest by trying the grid's digits first
+    gridBits = [t.BIT[value] for value in values]
+    for i in range(0, len(group)):
+        trial = masks[:]
+        for c in group[:i]:
+            trial[c] = t.BIT[values[c]]
+        trial[group[i]] &= ~t.BIT[values[group[i]]]
+        if not trial[group[i]]:
+            continue
+
+        # The clues' digits are already ruled out of their peers, so only
+        # empty cells down to a single candidate need propagating
+        queue = [c for c in range(0, t.CELLS) if not filled[c] and t.BIT_COUNT[trial[c]] == 1]
+        if propagateSingles(trial, queue, t) and searchMasks(trial, t, 1, gridBits) > 0:
+            return True
+    return False
+
+
+# Removes the digit of each cell in queue, which has a single candidate, from its peers,
+# adding any peer left with a single candidate to the queue. False on a contradiction.
+def propagateSingles(masks, queue, t):
+    PEERS, BIT_COUNT = t.PEERS, t.BIT_COUNT
+    while queue:
+        cell = queue.pop()
+        bit = masks[cell]
+        for peer in PEERS[cell]:
+            mask = masks[peer]
+            if mask & bit:
+                mask ^= bit
+                if not mask:
+                    return False
+                masks[peer] = mask
+                if BIT_COUNT[mask] == 1:
+                    queue.append(peer)
+    return True
+
+
+# Counts the solutions of a puzzle given as candidate masks, with every single candidate
+# already propagated, stopping at cap. The search branches on the cell with the fewest
+# candidates, and propagates each choice with propagateSingles. If given, preferred
+# holds a bit per cell to try before the cell's other candidates.
+def searchMasks(masks, t, cap, preferred=None):
+    BIT_COUNT = t.BIT_COUNT
+    best = -1
+    bestCount = t.SIZE + 1
+    for cell in range(0, t.CELLS):
+        count = BIT_COUNT[masks[cell]]
+        if 1 < count < bestCount:
+            best = cell
+            bestCount = count
+            if count == 2:
+                break
+    if best < 0:
+        # Every cell has one candidate left, and none clash
+        return 1
+
+    free = masks[best]
+    bits = []
+    if preferred is not None and free & preferred[best]:
+        bits.append(preferred[best])
+        free ^= preferred[best]
+    while free:
+        bit = free & -free
+        free ^= bit
+        bits.append(bit)
+
+    found = 0
+    for bit in bits:
+        child = masks[:]
+        child[best] = bit
+        if propagateSingles(child, [best], t):
+            found += searchMasks(child, t, cap - found, preferred)
+            if found >= cap:
+                break
+    return found
+
+
+# Grades a puzzle by solving it with SudokuConstraintSolver.
+# Returns the grade, the search nodes, and the techniques used, in the order the solver tries them.
+def gradePuzzle(puzzle, boxSize=3):
+    solver = SudokuConstraintSolver(boxSize)
+    list(islice(solver.iter_solutions(puzzle), 1))
+
+    techniques = [name for name in TECHNIQUES if name in solver.techniqueUses]
+    if solver.backtracks >= HARDEST_BACKTRACKS:
+        grade = 'hardest'
+    elif solver.nodes > 0:
+        grade = 'hard'
+    elif techniques:
+        grade = 'medium'
+    else:
+        grade = 'easy'
+    return grade, solver.nodes, techniques
+
+
+# Random source of puzzle index of a run with the given seed.
+# Seeded by a hash of the pair, so no two runs share any puzzle's source.
+def puzzleRandom(seed, index):
+    digest = hashlib.sha1('%d:%d' % (seed, index)).hexdigest()
+    return random.Random(int(digest, 16))
+
+
+# Generates and grades puzzle index of a run, returning it as a dict
+def generatePuzzle(seed, index, symmetric=False, boxSize=3):
+    rng = puzzleRandom(seed, index)
+    grid = randomGrid(rng, boxSize)
+    puzzle = removeClues(grid, rng, symmetric)
+    grade, nodes, techniques = gradePuzzle(puzzle, boxSize)
+    return {
+        'index': index,
+        'puzzle': puzzle,
+        'solution': grid,
+        'grade': grade,
+        'clues': sum(1 for row in puzzle for num in row if num != 0),
+        'nodes': nodes,
+        'techniques': techniques,
+    }
+
+
+def formatLine(result):
+    return '\t'.join([Puzzles.format(result['puzzle']), result['grade'], str(result['clues']),
+                      str(result['nodes']), ','.join(result['techniques']) or '-'])
+
+
+# Generates puzzle index of a run, returning its output line.
+# Runs in the worker processes.
+def generateLine(task):
+    seed, index, symmetric = task
+    result = generatePuzzle(seed, index, symmetric)
+    return result['grade'], formatLine(result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate sudoku puzzles with a unique solution, graded by difficulty.")
+    parser.add_argument("-n", "--count", type=int, default=100,
+                        help="number of puzzles to write (default: 100)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the run, the same seed gives the same puzzles (default: 0)")
+    parser.add_argument("--grades", nargs="+", choices=GRADES, default=GRADES,
+                        help="only write puzzles of these grades (default: all)")
+    parser.add_argument("--symmetric", action="store_true",
+                        help="remove clues in pairs opposite the centre, for symmetric puzzles")
+    parser.add_argument("-o", "--output", default="-",
+                        help="file to write puzzles to (default: stdout)")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--chunksize", type=int, default=16,
+                        help="number of puzzles sent to a worker at a time (default: 16)")
+    args = parser.parse_args(argv)
+
+    sink = sys.stdout if args.output == "-" else open(args.output, "w")
+    processes = args.processes or multiprocessing.cpu_count()
+
+    # Puzzles are made in index order, a batch at a time, until enough of the wanted grades
+    # are written. With --grades, puzzles of other grades are made and dropped along the way.
+    index = 0
+    written = 0
+    try:
+        while written < args.count:
+            batch = max(args.count - written, args.chunksize * processes)
+            tasks = [(args.seed, i, args.symmetric) for i in range(index, index + batch)]
+            index += batch
+
+            results = runPool(generateLine, tasks, processes, args.chunksize)
+            try:
+                for grade, line in results:
+                    if grade not in args.grades:
+                        continue
+                    sink.write(line + "\n")
+                    written += 1
+                    if written == args.count:
+                        break
+                    # Flush about once per chunk, so puzzles are written as they are made
+                    if written % args.chunksize == 0:
+                        sink.flush()
+            finally:
+                results.close()
+    finally:
+        if sink is not sys.stdout:
+            sink.close()
+
+
+
+#
+#   Main Entry Point
+#
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import argparse
+import threading
+import multiprocessing
+from Queue import Empty
+from itertools import islice
+import Puzzles
+from OCR_1 import OCR
+from OCRModels import getOCR, prepareModel
+from SudokuExtractor import SudokuExtractor
+from SudokuConstraintSolver import SudokuConstraintSolver
+
+# Summary
+# -------
+# Extracts, recognizes and solves the puzzles in many images, as a pipeline.
+#
+# Images are read and extracted (decoding, preprocessing, finding the grid and
+# OCR) by one pool of processes, and the recognized puzzles are solved by
+# another, so extraction of the next images overlaps with solving.
+# The stages are connected by bounded queues, so memory stays flat however
+# many images are given.
+#
+# Each output line is a JSON object for one image, with its status:
+#   solved       the puzzle and its solution are given
+#   no_solution  a puzzle was recognized, but has no solution (usually an OCR error)
+#   no_grid      no grid was found in the image
+#   error        the image could not be read, with the error message
+#
+# Usage
+# -----
+# python SudokuImageBatch.py photos/ -o results.jsonl
+# python SudokuImageBatch.py sudoku_original.jpg sudoku_original_2.jpg --ordered
+#
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+# Expands directories into the images they hold, in name order
+def listImages(inputs):
+    images = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    images.append(os.path.join(path, name))
+        else:
+            images.append(path)
+    return images
+
+
+# Reads (index, image) tasks until it gets None.
+# Recognized puzzles are passed on to the solvers, anything else goes straight to the results.
+def extractWorker(tasks, puzzles, results, pyramid_size):
+    extractor = SudokuExtractor(headless=True, pyramid_size=pyramid_size)
+
+    for index, image in iter(tasks.get, None):
+        try:
+            result = extractor.extractResult(image)
+        except Exception as e:
+            results.put((index, {'image': image, 'status': 'error', 'error': str(e)}))
+            continue
+
+        if not result.found:
+            results.put((index, {'image': image, 'status': 'no_grid'}))
+        else:
+            puzzles.put((index, image, [[int(num) for num in row] for row in result.puzzle]))
+
+
+# Reads (index, image, puzzle) tasks until it gets None, and solves them
+def solveWorker(puzzles, results):
+    for index, image, puzzle in iter(puzzles.get, None):
+        line = {'image': image, 'puzzle': Puzzles.format(puzzle)}
+        solutions = list(islice(SudokuConstraintSolver().iter_solutions(puzzle), 1))
+        if len(solutions) == 0:
+            line['status'] = 'no_solution'
+        else:
+            line['status'] = 'solved'
+            line['solution'] = Puzzles.format(solutions[0])
+        results.put((index, line))
+
+
+# Puts every image on the task queue, then one stop per extract worker.
+# Runs in its own thread, as the queue blocks while the workers are busy.
+def feedTasks(images, tasks, workers):
+    for task in enumerate(images):
+        tasks.put(task)
+    for _ in range(workers):
+        tasks.put(None)
+
+
+# Yields (index, line) results as they finish, checking the workers are still alive while waiting
+def collectResults(results, count, workers):
+    for _ in range(count):
+        while True:
+            try:
+                yield results.get(timeout=1)
+                break
+            except Empty:
+                for worker in workers:
+                    if worker.exitcode not in (None, 0):
+                        raise RuntimeError("Worker process exited with code %d" % worker.exitcode)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract and solve the sudoku puzzles in many images.")
+    parser.add_argument("inputs", nargs="+",
+                        help="images, or directories of images")
+    parser.add_argument("-o", "--output", default="-",
+                        help="file to write JSON lines to (default: stdout)")
+    parser.add_argument("-p", "--processes", type=int, default=multiprocessing.cpu_count(),
+                        help="number of extraction processes (default: number of cores)")
+    parser.add_argument("-s", "--solvers", type=int, default=1,
+                        help="number of solving processes (default: 1)")
+    parser.add_argument("-q", "--queue-size", type=int, default=None,
+                        help="most images waiting between stages (default: 2 per process)")
+    parser.add_argument("--pyramid-size", type=int, default=None,
+                        help="find grids on downscaled copies of images twice this size or larger")
+    parser.add_argument("--ordered", action="store_true",
+                        help="write results in input order, instead of as they finish")
+    args = parser.parse_args(argv)
+
+    images = listImages(args.inputs)
+
+    # Load the OCR model before starting the workers, so they all share this copy
+    # instead of each loading (or rebuilding) it. Training prints its progress
+    # to stderr, to keep the output valid JSON.
+    prepareModel(OCR)
+    getOCR(OCR)
+
+    queue_size = args.queue_size or 2 * (args.processes + args.solvers)
+
+    tasks = multiprocessing.Queue(queue_size)
+    puzzles = multiprocessing.Queue(queue_size)
+    results = multiprocessing.Queue(queue_size)
+
+    workers = [multiprocessing.Process(target=extractWorker, args=(tasks, puzzles, results, args.pyramid_size))
+               for _ in range(args.processes)]
+    workers += [multiprocessing.Process(target=solveWorker, args=(puzzles, results))
+                for _ in range(args.solvers)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    feeder = threading.Thread(target=feedTasks, args=(images, tasks, args.processes))
+    feeder.daemon = True
+    feeder.start()
+
+    sink = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        # Results that finished before an earlier image, held back when ordered
+        pending = {}
+        next_index = 0
+        for index, line in collectResults(results, len(images), workers):
+            if not args.ordered:
+                sink.write(json.dumps(line, sort_keys=True) + "\n")
+                sink.flush()
+                continue
+
+            pending[index] = line
+            while next_index in pending:
+                sink.write(json.dumps(pending.pop(next_index), sort_keys=True) + "\n")
+                next_index += 1
+            sink.flush()
+    except:
+        # Interrupted or output closed, stop the workers without waiting for them
+        for worker in workers:
+            worker.terminate()
+        raise
+    else:
+        # Every image is done, so only the solvers are still waiting for work
+        for _ in range(args.solvers):
+            puzzles.put(None)
+        feeder.join()
+        for worker in workers:
+            worker.join()
+    finally:
+        if sink is not sys.stdout:
+            sink.close()
+
+
+
+#
+#   Main Entry Point
+#
+if __name__ == '__main__':
+    main()
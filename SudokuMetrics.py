@@ -0,0 +1,104 @@
+import time
+import logging
+import threading
+
+# Summary
+# -------
+# Per-stage timing and counters for the extractor and the solvers.
+#
+# Each stage reports a record to a sink when it finishes. A record is a dict
+# with the stage's name, its wall time in seconds, and counters of the work it
+# did, such as contours found, digits recognized, or search nodes and backtracks.
+#
+# A sink is any callable taking a record, such as:
+#   a function of your own
+#   LogSink(), which logs one line per record
+#   MetricsDict(), which adds up the records of each stage, for export()
+#
+# Stages
+# ------
+# SudokuExtractor:         getPuzzle, preprocessImages, findPuzzle, findPuzzlePyramid,
+#                          trackPuzzle, simpleWarp, extractDigits, recognizeDigits
+# SudokuConstraintSolver:  constraint.propagation, constraint.search
+# SudokuDLXSolver:         dlx.search
+# SudokuBacktrackingSolver: backtracking.search, mrv.search
+#
+# Usage
+# -----
+# metrics = MetricsDict()
+# SudokuExtractor(headless=True, sink=metrics).extractResult("sudoku_original.jpg")
+# SudokuConstraintSolver(sink=metrics).solve(puzzle)
+# print metrics.export()
+#
+
+
+# Sends a record of a stage to sink, if there is one
+def report(sink, stage, seconds, **counters):
+    if sink is None:
+        return
+    record = counters
+    record['stage'] = stage
+    record['seconds'] = seconds
+    sink(record)
+
+
+# Yields the items of a search, then reports it to sink once it finishes or the
+# caller stops iterating. Only the time spent inside the search is counted, not
+# the time the caller holds each item. counters() gives the search's counters.
+def timedSearch(sink, stage, search, counters):
+    seconds = 0.0
+    start = time.time()
+    try:
+        for item in search:
+            seconds += time.time() - start
+            yield item
+            start = time.time()
+        seconds += time.time() - start
+    finally:
+        report(sink, stage, seconds, **counters())
+
+
+# Logs one line per record
+class LogSink:
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('sudoku.metrics')
+        self.level = level
+
+    def __call__(self, record):
+        fields = ['%s %.2fms' % (record['stage'], record['seconds'] * 1000)]
+        fields += ['%s=%s' % (name, record[name]) for name in sorted(record) if name not in ('stage', 'seconds')]
+        self.logger.log(self.level, ' '.join(fields))
+
+
+# Adds up the records of each stage: how many there were, their total and
+# slowest time, and the total of each counter. Safe to share between threads.
+class MetricsDict:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def __call__(self, record):
+        with self.lock:
+            stage = self.stages.get(record['stage'])
+            if stage is None:
+                stage = {'calls': 0, 'seconds': 0.0, 'maxSeconds': 0.0}
+                self.stages[record['stage']] = stage
+
+            stage['calls'] += 1
+            stage['seconds'] += record['seconds']
+            stage['maxSeconds'] = max(stage['maxSeconds'], record['seconds'])
+            for name, value in record.items():
+                if name not in ('stage', 'seconds'):
+                    stage[name] = stage.get(name, 0) + value
+
+    # A copy of the totals so far, keyed by stage, with the mean time of each stage added
+    def export(self):
+        with self.lock:
+            stages = dict((name, dict(stage)) for name, stage in self.stages.items())
+        for stage in stages.values():
+            stage['meanSeconds'] = stage['seconds'] / stage['calls']
+        return stages
+
+    def clear(self):
+        with self.lock:
+            self.stages = {}
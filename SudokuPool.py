@@ -0,0 +1,46 @@
+import multiprocessing
+
+# Summary
+# -------
+# Runs a function over many items across a pool of worker processes, for the
+# command line tools.
+#
+# Results are yielded as they come in. If the caller stops iterating, or is
+# interrupted, the workers are stopped at once without waiting for them.
+# Otherwise the pool is closed once every result is in.
+#
+# Usage
+# -----
+# results = runPool(solveLine, lines, processes=8, chunksize=64)
+# try:
+#     for result in results:
+#         ...
+# finally:
+#     results.close()
+#
+# Closing the results in a finally block stops the workers straight away if the
+# loop raises, instead of whenever the generator is garbage collected.
+#
+
+
+# Yields worker(item) for each item, computed across processes workers (default:
+# number of cores). Results are in input order if ordered, else in the order they finish.
+# initializer(*initargs) is run in each worker when it starts.
+def runPool(worker, items, processes=None, chunksize=1, ordered=True, initializer=None, initargs=()):
+    pool = multiprocessing.Pool(processes, initializer, initargs)
+    try:
+        if ordered:
+            results = pool.imap(worker, items, chunksize)
+        else:
+            results = pool.imap_unordered(worker, items, chunksize)
+
+        for result in results:
+            yield result
+    except:
+        # Interrupted, closed early or output failed, stop the workers without waiting for them
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
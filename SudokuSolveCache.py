@@ -0,0 +1,235 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from itertools import permutations, product
+import numpy as np
+import Puzzles
+from SudokuConstraintSolver import SudokuConstraintSolver
+
+# Summary
+# -------
+# Caches solutions in front of a solver, sharing them between puzzles that are
+# the same up to Sudoku symmetries: relabeling the digits, transposing, and
+# swapping rows within a band, columns within a stack, bands, or stacks.
+#
+# Each puzzle is turned into a canonical form by one of those symmetries, and
+# solutions are cached under it. A hit is mapped back to the caller's puzzle
+# by undoing the symmetry, so it is a solution of the puzzle as it was given.
+#
+# The canonical form is the smallest of the puzzle's arrangements (with digits
+# relabeled in order of first appearance), among those that order rows, columns,
+# bands and stacks by how their clues are spread. Puzzles with many lines that
+# look alike have too many such arrangements to try them all, so only the first
+# max_orders orders of rows and columns are tried. Two arrangements of such a
+# puzzle may then get different keys, which only costs a cache miss, as any key
+# is still an arrangement of the puzzle.
+#
+# The cache holds up to capacity puzzles, dropping the least recently used, and
+# can be saved to and loaded from a JSON file.
+#
+# Usage
+# -----
+# cache = SudokuSolveCache(capacity=100000)
+# cache = SudokuSolveCache(lambda: SudokuDLXSolver(), capacity=100000)
+# cache.load("solutions.json")
+# solutions = cache.solve(puzzle)
+# cache.save("solutions.json")
+#
+
+CACHE_VERSION = 1
+
+# Characters of the digits in cache keys, so boards up to 25x25 are one character per cell
+DIGITS = '0123456789ABCDEFGHIJKLMNOP'
+
+
+# Yields every order of items that sorts them by keys[item], in every order among items with equal keys
+def tiedOrders(items, keys):
+    groups = []
+    for item in sorted(items, key=keys.__getitem__):
+        if groups and keys[groups[-1][0]] == keys[item]:
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+    for choice in product(*[permutations(group) for group in groups]):
+        yield sum(choice, ())
+
+
+# Yields the orders of lines (rows, or columns) that sort bands (or stacks) and
+# the lines within each by their signatures, as a line can only move within its band
+def lineOrders(signatures, box):
+    bands = [tuple(sorted(signatures[band*box:band*box+box])) for band in range(0, box)]
+    for bandOrder in tiedOrders(range(0, box), bands):
+        lines = [tiedOrders(range(band*box, band*box+box), signatures) for band in bandOrder]
+        for order in product(*lines):
+            yield sum(order, ())
+
+
+# Signature of each row: its number of clues, how many clues the columns of those
+# clues have, and how often the digits of those clues appear in the puzzle.
+# None of these change when digits are relabeled or rows and columns are moved.
+def rowSignatures(grid, frequency):
+    filled = grid > 0
+    colCounts = filled.sum(axis=0)
+    return [(int(filled[r].sum()),
+             tuple(sorted(colCounts[filled[r]].tolist())),
+             tuple(sorted(frequency[grid[r][filled[r]]].tolist())))
+            for r in range(0, len(grid))]
+
+
+class SudokuSolveCache:
+
+    # Orders of rows, and of columns, tried at most when computing a canonical form
+    max_orders = 64
+
+    # solverFactory makes a solver with solve(puzzle), SudokuConstraintSolver by default.
+    # A new solver is made for each miss, as solvers keep their state on the instance,
+    # so the cache can be shared between threads.
+    # capacity is the number of puzzles kept.
+    def __init__(self, solverFactory=None, capacity=10000, boxSize=3):
+        self.box = boxSize
+        self.size = boxSize * boxSize
+        self.solverFactory = solverFactory or (lambda: SudokuConstraintSolver(boxSize))
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    # Solves a puzzle, returning the same solutions as the solver would, as lists of rows
+    def solve(self, puzzle):
+        key, cells, labels = self.canonicalForm(puzzle)
+
+        with self.lock:
+            solutions = self.entries.pop(key, None)
+            if solutions is not None:
+                # Put back as the most recently used
+                self.entries[key] = solutions
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if solutions is not None:
+            return [self.fromCanonical(solution, cells, labels) for solution in solutions]
+
+        found = self.solverFactory().solve(puzzle)
+        solutions = [self.toCanonical(solution, cells, labels) for solution in found]
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = solutions
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return [np.asarray(solution).tolist() for solution in found]
+
+
+    # Returns the canonical form of a puzzle as a key string, with the symmetry that gives it:
+    # cells, the puzzle's cell at each cell of the canonical form (in row-major order),
+    # and labels, the canonical digit of each of the puzzle's digits (0 for empty).
+    def canonicalForm(self, puzzle):
+        n = self.size
+        grid = np.array(puzzle, np.int32).reshape(n, n)
+        frequency = np.bincount(grid.ravel(), minlength=n+1)
+
+        # Every arrangement tried, as the puzzle's cell at each canonical cell
+        arrangements = []
+        for transposed in (False, True):
+            rowGrid = grid.T if transposed else grid
+            rows = list(self.firstOrders(lineOrders(rowSignatures(rowGrid, frequency), self.box)))
+            cols = list(self.firstOrders(lineOrders(rowSignatures(rowGrid.T, frequency), self.box)))
+            rows = np.array(rows)[:, None, :, None]
+            cols = np.array(cols)[None, :, None, :]
+            if transposed:
+                cells = cols * n + rows
+            else:
+                cells = rows * n + cols
+            arrangements.append(cells.reshape(-1, n*n))
+        arrangements = np.concatenate(arrangements)
+        values = grid.ravel()[arrangements]
+
+        # Relabel the digits of each arrangement in order of first appearance.
+        # Digits the puzzle does not have keep their order after the rest.
+        count = len(arrangements)
+        found = values[:, :, None] == np.arange(1, n+1)
+        first = np.where(found.any(axis=1), found.argmax(axis=1), n*n)
+        order = np.argsort(first, axis=1, kind='mergesort')
+        labels = np.zeros((count, n+1), np.int32)
+        labels[np.arange(count)[:, None], order + 1] = np.arange(1, n+1)
+        relabeled = labels[np.arange(count)[:, None], values]
+
+        # The smallest arrangement, comparing cells in row-major order
+        best = np.lexsort(relabeled.T[::-1])[0]
+        key = ''.join(DIGITS[v] for v in relabeled[best])
+        return key, arrangements[best], labels[best]
+
+
+    # The first max_orders of some orders
+    def firstOrders(self, orders):
+        for count, order in enumerate(orders):
+            if count == self.max_orders:
+                break
+            yield order
+
+
+    # A solution of the puzzle, as a key string of the canonical form's solution
+    def toCanonical(self, solution, cells, labels):
+        values = np.asarray(solution).ravel()
+        return ''.join(DIGITS[v] for v in labels[values[cells]])
+
+
+    # A solution of the canonical form, mapped back to the puzzle as a list of rows
+    def fromCanonical(self, solution, cells, labels):
+        n = self.size
+        digits = np.zeros(n+1, np.int32)
+        digits[labels] = np.arange(0, n+1)
+        values = np.zeros(n*n, np.int32)
+        values[cells] = digits[[DIGITS.index(ch) for ch in solution]]
+        return values.reshape(n, n).tolist()
+
+
+    # Writes the cache to a JSON file, from least to most recently used.
+    # The file is replaced in one step, so a reader never sees half of it.
+    def save(self, filename):
+        with self.lock:
+            entries = list(self.entries.items())
+        temporary = filename + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'box': self.box, 'entries': entries}, f)
+        os.rename(temporary, filename)
+
+
+    # Adds the entries of a file written by save(), if there is one.
+    # Files from another version or board size are ignored.
+    def load(self, filename):
+        if not os.path.exists(filename):
+            return
+        with open(filename) as f:
+            data = json.load(f)
+        if data.get('version') != CACHE_VERSION or data.get('box') != self.box:
+            return
+
+        with self.lock:
+            for key, solutions in data['entries']:
+                self.entries.pop(key, None)
+                self.entries[key] = solutions
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+
+#
+#   Main Entry Point
+#
+if __name__ == '__main__':
+    cache = SudokuSolveCache()
+    puzzle = Puzzles.parse(Puzzles.graded['hard'][0])
+    cache.solve(puzzle)
+
+    # The same puzzle transposed, with its digits relabeled, is answered from the cache
+    relabel = [0, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+    variant = [[relabel[puzzle[x][y]] for x in range(0, 9)] for y in range(0, 9)]
+    Puzzles.prettyPrint(cache.solve(variant)[0])
+    print "Hits:", cache.hits, "Misses:", cache.misses
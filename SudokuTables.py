@@ -0,0 +1,109 @@
+# Summary
+# -------
+# Lookup tables shared by the solvers, computed once per board size.
+#
+# Boards are made of boxes of box x box cells, so a board with box size 3
+# is the usual 9x9 grid, 4 is 16x16 and 5 is 25x25.
+#
+# Cells are numbered in row-major order, so cell (x, y) is y*size + x.
+# Candidates for a cell are kept as a bitmask, with bit (n-1) set
+# while n is still a possible answer for that cell.
+#
+# Usage
+# -----
+# tables = getTables(4) for the tables of a 16x16 board.
+# The module level names below are the tables of the 9x9 board.
+#
+
+
+# Number of set bits in a mask of up to 32 bits, looked up in a table of
+# 16-bit counts a half at a time. Used on boards whose masks are too wide for a full table.
+class SplitBitCounts:
+    def __init__(self, halfCounts):
+        self.halfCounts = halfCounts
+
+    def __getitem__(self, mask):
+        return self.halfCounts[mask & 0xFFFF] + self.halfCounts[mask >> 16]
+
+
+class Tables:
+
+    def __init__(self, box):
+        size = box * box
+        cells = size * size
+
+        self.BOX = box
+        self.SIZE = size
+        self.CELLS = cells
+
+        # Mask with every digit set
+        self.ALL = (1 << size) - 1
+
+        # Bit for each digit (index 0 unused, so BIT[n] is the bit for n)
+        self.BIT = [0] + [1 << i for i in range(size)]
+
+        # Digit for each single-bit mask
+        self.BIT_DIGIT = dict((1 << i, i + 1) for i in range(size))
+
+        # Number of set bits for every mask. A list is fastest, but is only
+        # built while it stays small (up to 16x16 boards). Wider masks are
+        # counted in two halves with the 16x16 board's table.
+        if size <= 16:
+            self.BIT_COUNT = [bin(m).count('1') for m in range(self.ALL + 1)]
+        else:
+            self.BIT_COUNT = SplitBitCounts(getTables(4).BIT_COUNT)
+
+        self.ROW_OF = [c // size for c in range(cells)]
+        self.COL_OF = [c % size for c in range(cells)]
+        self.BOX_OF = [(c // size // box) * box + (c % size) // box for c in range(cells)]
+
+        # Units are the rows, then the columns, then the boxes
+        self.ROWS = [tuple(y * size + x for x in range(size)) for y in range(size)]
+        self.COLS = [tuple(y * size + x for y in range(size)) for x in range(size)]
+        self.BOXES = [tuple(c for c in range(cells) if self.BOX_OF[c] == b) for b in range(size)]
+        self.UNITS = self.ROWS + self.COLS + self.BOXES
+
+        # The three units each cell belongs to
+        self.CELL_UNITS = [(self.ROWS[self.ROW_OF[c]], self.COLS[self.COL_OF[c]], self.BOXES[self.BOX_OF[c]])
+                           for c in range(cells)]
+
+        # Every other cell sharing a unit with a cell
+        self.PEERS = [tuple(sorted(set(sum(self.CELL_UNITS[c], ())) - set([c]))) for c in range(cells)]
+
+
+    # The digits set in a mask
+    def maskDigits(self, mask):
+        return tuple(n for n in range(1, self.SIZE + 1) if mask & self.BIT[n])
+
+
+tablesByBox = {}
+
+# Returns the tables for a box size, building them on first use
+def getTables(box=3):
+    if box not in tablesByBox:
+        tablesByBox[box] = Tables(box)
+    return tablesByBox[box]
+
+
+# Tables of the 9x9 board
+TABLES = getTables(3)
+
+SIZE = TABLES.SIZE
+BOX = TABLES.BOX
+CELLS = TABLES.CELLS
+ALL = TABLES.ALL
+BIT = TABLES.BIT
+BIT_DIGIT = TABLES.BIT_DIGIT
+BIT_COUNT = TABLES.BIT_COUNT
+
+ROW_OF = TABLES.ROW_OF
+COL_OF = TABLES.COL_OF
+BOX_OF = TABLES.BOX_OF
+
+ROWS = TABLES.ROWS
+COLS = TABLES.COLS
+BOXES = TABLES.BOXES
+UNITS = TABLES.UNITS
+
+CELL_UNITS = TABLES.CELL_UNITS
+PEERS = TABLES.PEERS